@@ -0,0 +1,56 @@
+"""Per-request cost of reading JWT claims: get_token_data per claim vs one get_auth_context.
+
+Run from the project root with the project settings & the Authorization header of a valid token:
+
+    DJANGO_SETTINGS_MODULE=<project settings> python benchmarks/bench_auth_context.py '<Authorization header>' [count]
+
+A request of DepartmentView.post reads accountId, isSuperAdmin, iss & isAdmin and decodes the full token
+for is_allowed/get_account_contact, the benchmark replays those reads.
+"""
+import sys
+import timeit
+
+import django
+
+CLAIMS = ('accountId', 'isSuperAdmin', 'iss', 'isAdmin')
+
+
+def main():
+    authorization = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    django.setup()
+    from django.test import RequestFactory
+
+    from department import get_auth_context
+    from src.helper.helpers import get_token_data
+
+    factory = RequestFactory()
+
+    def per_claim():
+        # before: every claim decodes the token again, plus one full decode
+        request = factory.post('/', HTTP_AUTHORIZATION=authorization)
+        claims = [get_token_data(request.META, claim) for claim in CLAIMS]
+        claims.append(get_token_data(request.META, key=None, all=True))
+        return claims
+
+    def auth_context():
+        # after: one decode per request, claims read from the request-scoped context
+        request = factory.post('/', HTTP_AUTHORIZATION=authorization)
+        context = get_auth_context(request)
+        return [context.get(claim) for claim in CLAIMS] + [context]
+
+    def baseline():
+        # building the request alone, subtracted from both
+        return factory.post('/', HTTP_AUTHORIZATION=authorization)
+
+    assert get_auth_context(baseline()), 'the Authorization header does not decode to any claim'
+
+    overhead = min(timeit.repeat(baseline, number=count, repeat=5))
+    for name, read in (('get_token_data per claim', per_claim), ('get_auth_context', auth_context)):
+        elapsed = min(timeit.repeat(read, number=count, repeat=5)) - overhead
+        print('{:<26} {:>7} requests {:>8.3f}s {:>8.2f} us/request'.format(
+            name, count, elapsed, elapsed / count * 1000000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Messages per second of department mail: one SMTP connection per mail vs a MailBatch on one connection.
+
+Run from the project root with the project settings:
+
+    DJANGO_SETTINGS_MODULE=<project settings> python benchmarks/bench_mail_batch.py [count]
+
+Mail goes to an SMTP stand-in started by this script on localhost, nothing leaves the machine.
+"""
+import socketserver
+import sys
+import threading
+import time
+
+import django
+
+
+class SMTPStandIn(socketserver.StreamRequestHandler):
+    # just enough SMTP for smtplib: greeting, EHLO, MAIL/RCPT/RSET/NOOP, DATA & QUIT
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode())
+
+    def handle(self):
+        self.reply('220 localhost SMTP stand-in')
+        for line in self.rfile:
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250-localhost')
+                self.reply('250 8BITMIME')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data in self.rfile:
+                    if data in (b'.\r\n', b'.\n'):
+                        break
+                self.reply('250 Queued')
+            elif command.startswith('QUIT'):
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def build_mails(count):
+    from department import invitation_department_mail
+
+    # fixed label, the benchmark measures delivery & rendering, not the label lookup
+    def label(member_type=''):
+        return 'Label', 'noreply@example.com', 'Corporate', 'Bisnis'
+
+    return [invitation_department_mail('user{}@example.com'.format(number), 'Finance', get_mail_label=label)
+            for number in range(count)]
+
+
+def send_per_mail(mails):
+    # what a single send does: render the template & open a new connection for every mail
+    from django.core.mail import EmailMultiAlternatives, get_connection
+    from django.template.loader import get_template
+    from django.utils.html import strip_tags
+
+    for mail, content, template in mails:
+        html = get_template(template).render(content)
+        message = EmailMultiAlternatives(mail['subject'], strip_tags(html), mail['from_email'], [mail['to']],
+                                         connection=get_connection())
+        message.attach_alternative(html, 'text/html')
+        message.send()
+
+
+def send_batch(mails):
+    from department import MailBatch
+
+    batch = MailBatch(shared_connection=True)
+    try:
+        for mail in mails:
+            batch.send(*mail)
+    finally:
+        batch.close()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    django.setup()
+    from django.test.utils import override_settings
+
+    server = SMTPServer(('127.0.0.1', 0), SMTPStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    smtp_settings = {
+        'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+        'EMAIL_HOST': '127.0.0.1',
+        'EMAIL_PORT': server.server_address[1],
+        'EMAIL_HOST_USER': '',
+        'EMAIL_HOST_PASSWORD': '',
+        'EMAIL_USE_TLS': False,
+        'EMAIL_USE_SSL': False,
+    }
+
+    with override_settings(**smtp_settings):
+        mails = build_mails(count)
+        for name, sender in (('connection per mail', send_per_mail), ('MailBatch connection', send_batch)):
+            started = time.perf_counter()
+            sender(mails)
+            elapsed = time.perf_counter() - started
+            print('{:<20} {:>6} mails {:>8.3f}s {:>10.1f} msg/s'.format(name, count, elapsed, count / elapsed))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
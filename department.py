@@ -1,17 +1,34 @@
+import csv
 import json
 import logging
-import math
+import os
+import threading
+import tempfile
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from functools import partial
+from types import MappingProxyType
 
 from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.paginator import Paginator, EmptyPage
-from django.db import transaction
-from django.db.models import OuterRef, Subquery, Count, IntegerField, Case, When, F, Q
+from django.db import connection, models, transaction
+from django.db.models import OuterRef, Subquery, Count, IntegerField, Case, When, F, Q, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.http import HttpRequest
 from django.shortcuts import get_object_or_404
+from django.template.loader import get_template
 from django.utils.decorators import method_decorator
+from django.utils.html import strip_tags
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework import status as rest_status
+from rest_framework import serializers, status as rest_status
 from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 from validate_email import validate_email
@@ -22,7 +39,7 @@ from src.accountcontact.serializers import AccContactSerializer
 from src.budgethistory.views import save_budget
 from src.contact.models import Contact
 from src.contact.models import ContactDepartmentApproval, ContactDepartmentRequestor
-from src.contact.serializers import ContactSerializers, ContactDeptApprovalSerializer, ContactDeptRequestorSerializer
+from src.contact.serializers import ContactDeptApprovalSerializer, ContactDeptRequestorSerializer
 # load model
 from src.department.models import Department
 # load serializer
@@ -46,6 +63,83 @@ from src.user.views import get_user_id
 
 log = logging.getLogger(__name__)
 
+IDOR_CACHE_TIMEOUT = getattr(settings, 'DEPARTMENT_IDOR_CACHE_TIMEOUT', 300)
+IDOR_CACHE_VERSION = 'department-idor-version'
+ACCOUNT_FAMILY_CACHE_TIMEOUT = getattr(settings, 'ACCOUNT_FAMILY_CACHE_TIMEOUT', 300)
+ACCOUNT_FAMILY_CACHE_VERSION = 'account-family-version'
+MAIL_WORKERS = getattr(settings, 'DEPARTMENT_MAIL_WORKERS', 4)
+MAIL_RETRIES = getattr(settings, 'DEPARTMENT_MAIL_RETRIES', 8)
+MAIL_RETRY_DELAY = getattr(settings, 'DEPARTMENT_MAIL_RETRY_DELAY', 15)
+MAIL_BATCH_CONNECTION = getattr(settings, 'DEPARTMENT_MAIL_BATCH_CONNECTION', False)
+MAIL_OUTBOX_BATCH = getattr(settings, 'DEPARTMENT_MAIL_OUTBOX_BATCH', 200)
+MAIL_OUTBOX_LEASE = getattr(settings, 'DEPARTMENT_MAIL_OUTBOX_LEASE', 300)
+MAIL_OUTBOX_TIMEOUT = getattr(settings, 'DEPARTMENT_MAIL_OUTBOX_TIMEOUT', 60 * 60 * 24 * 7)
+
+CONTACT_SEARCH_INDEX_MAX_HITS = getattr(settings, 'DEPARTMENT_CONTACT_INDEX_MAX_HITS', 1000)
+DEPARTMENT_SEARCH_INDEX_MAX_HITS = getattr(settings, 'DEPARTMENT_SEARCH_INDEX_MAX_HITS', 1000)
+SEARCH_TRIGRAM = getattr(settings, 'DEPARTMENT_SEARCH_TRIGRAM', False)
+APPROVAL_CHAIN_CACHE_TIMEOUT = getattr(settings, 'DEPARTMENT_APPROVAL_CHAIN_CACHE_TIMEOUT', 300)
+APPROVAL_CHAIN_CACHE_KEY = 'department-approval-chain:{}'
+IMPORT_CHUNK_SIZE = getattr(settings, 'DEPARTMENT_IMPORT_CHUNK_SIZE', 500)
+IMPORT_MAX_ERRORS = getattr(settings, 'DEPARTMENT_IMPORT_MAX_ERRORS', 1000)
+IMPORT_DIR = getattr(settings, 'DEPARTMENT_IMPORT_DIR', tempfile.gettempdir())
+IMPORT_WORKERS = getattr(settings, 'DEPARTMENT_IMPORT_WORKERS', 2)
+IMPORT_FILE_PREFIX = 'department-import-'
+IMPORT_FORMAT_CSV = 'csv'
+IMPORT_FORMAT_NDJSON = 'ndjson'
+INVITE_WORKERS = getattr(settings, 'DEPARTMENT_INVITE_WORKERS', 4)
+JOB_TIMEOUT = getattr(settings, 'DEPARTMENT_JOB_TIMEOUT', 60 * 60 * 24)
+JOB_LEASE = getattr(settings, 'DEPARTMENT_JOB_LEASE', 300)
+JOB_KEY = 'department-{}:{}'
+JOB_STATUS_PENDING = 'PENDING'
+JOB_STATUS_RUNNING = 'RUNNING'
+JOB_STATUS_DONE = 'DONE'
+JOB_STATUS_FAILED = 'FAILED'
+REQUEST_CONTEXT_META = ('REMOTE_ADDR', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_REAL_IP', 'HTTP_USER_AGENT', 'HTTP_HOST',
+                        'HTTP_X_FORWARDED_HOST', 'HTTP_X_FORWARDED_PROTO', 'HTTP_ORIGIN', 'HTTP_REFERER',
+                        'SERVER_NAME', 'SERVER_PORT', 'wsgi.url_scheme')
+
+
+class WorkerPool:
+    """Thread pool started on its first task, so importing the module starts no thread.
+
+    Under a preforking server (uWSGI, gunicorn --preload) the threads are started by the worker process that
+    submits work, and a process forked after that starts its own pool instead of inheriting dead threads.
+    """
+
+    def __init__(self, max_workers, name):
+        self.max_workers = max_workers
+        self.name = name
+        self.reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, fn, *args, **kwargs):
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self.executor.submit(fn, *args, **kwargs)
+
+
+mail_executor = WorkerPool(MAIL_WORKERS, 'department-mail')
+import_executor = WorkerPool(IMPORT_WORKERS, 'department-import')
+invite_executor = WorkerPool(INVITE_WORKERS, 'department-invite')
+
+
+def get_auth_context(request):
+    # decode JWT claims once per request, every view & helper of this module reads the same read-only copy
+    http_request = getattr(request, '_request', request)
+    auth_context = getattr(http_request, 'auth_context', None)
+    if auth_context is None:
+        auth_context = MappingProxyType(dict(get_token_data(http_request.META, key=None, all=True) or {}))
+        http_request.auth_context = auth_context
+    return auth_context
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class UnitBussinessView(APIView):
@@ -101,8 +195,10 @@ class UnitBussinessView(APIView):
         search = serializer.data['search']
         account_id = serializer.data['accountId']
 
+        cursor = self.request.GET.get('cursor', '')
+
         if account_id:
-            return self.get_all_by_account(account_id, page, limit)
+            return self.get_all_by_account(account_id, page, limit, cursor)
 
         if not dept_id:
             return response(rest_status.HTTP_200_OK, message=UNIT_BUSSINESS,  status=True)
@@ -113,7 +209,12 @@ class UnitBussinessView(APIView):
 
         nonstrict()
         units = Department.objects.filter(query_filter)
-        paginator = Paginator(UnitBussinessSerializers(units, many=True).data, limit)
+        if cursor:
+            units, meta = keyset_page(units, cursor, limit)
+            return response(rest_status.HTTP_200_OK, data=UnitBussinessSerializers(units, many=True).data,
+                            message=UNIT_BUSSINESS, meta=meta, status=True)
+
+        paginator = Paginator(units.order_by('name', 'id'), limit)
         meta = {
             "totalRecords": paginator.count,
             "totalPages": paginator.num_pages,
@@ -122,30 +223,36 @@ class UnitBussinessView(APIView):
         }
 
         return response(rest_status.HTTP_200_OK,
-                        data=paginator.page(page).object_list, message=UNIT_BUSSINESS, meta=meta, status=True)
+                        data=UnitBussinessSerializers(paginator.page(page).object_list, many=True).data,
+                        message=UNIT_BUSSINESS, meta=meta, status=True)
 
-    def get_all_by_account(self, account_id, page, limit):
+    def get_all_by_account(self, account_id, page, limit, cursor=''):
         try:
-            token = get_token_data(self.request.META, key=None, all=True)
+            token = get_auth_context(self.request)
             if 'accountId' in token and token['accountId'] != account_id:
                 return response(rest_status.HTTP_200_OK, data=[], message=DATA_NOT_FOUND)
             units = Department.objects.filter(type='UNIT', account_id=account_id)
-            paginator = Paginator(UnitBussinessSerializers(units, many=True).data, limit)
-            meta = {
-                "totalRecords": paginator.count,
-                "totalPages": paginator.num_pages,
-                "page": page,
-                "limit": limit
-            }
-            data = paginator.page(page).object_list if paginator.page(page).object_list else []
-            meta_data = meta if paginator.page(page).object_list else None
-            message = UNIT_BUSSINESS if paginator.page(page).object_list else DATA_NOT_FOUND
+            if cursor:
+                units, meta = keyset_page(units, cursor, limit)
+            else:
+                paginator = Paginator(units.order_by('name', 'id'), limit)
+                units = paginator.page(page).object_list
+                meta = {
+                    "totalRecords": paginator.count,
+                    "totalPages": paginator.num_pages,
+                    "page": page,
+                    "limit": limit
+                }
+            object_list = UnitBussinessSerializers(units, many=True).data
+            data = object_list if object_list else []
+            meta_data = meta if object_list else None
+            message = UNIT_BUSSINESS if object_list else DATA_NOT_FOUND
             return response(rest_status.HTTP_200_OK, data=data, message=message, meta=meta_data, status=True)
         except EmptyPage:
             return response(rest_status.HTTP_200_OK, data=[], message=DATA_NOT_FOUND)
 
     def is_allowed(self, account_id):
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
         if token.get('iss') != settings.JWT_ISSUER:
             return True
 
@@ -226,8 +333,9 @@ class SubunitBussinessView(APIView):
         limit = serializer.data['limit']
         search = serializer.data['search']
         account_id = serializer.data['accountId']
+        cursor = self.request.GET.get('cursor', '')
         if account_id:
-            return self.get_all_by_account(account_id, page, limit)
+            return self.get_all_by_account(account_id, page, limit, cursor)
 
         query_filter = Q(parent_id=unit_id)
         if search:
@@ -235,7 +343,12 @@ class SubunitBussinessView(APIView):
 
         nonstrict()
         sub_units = Department.objects.filter(query_filter)
-        paginator = Paginator(SubunitBussinessSerializers(sub_units, many=True).data, limit)
+        if cursor:
+            sub_units, meta = keyset_page(sub_units, cursor, limit)
+            return response(rest_status.HTTP_200_OK, data=SubunitBussinessSerializers(sub_units, many=True).data,
+                            message="Subunit Bussiness", meta=meta, status=True)
+
+        paginator = Paginator(sub_units.order_by('name', 'id'), limit)
         meta = {
             "totalRecords": paginator.count,
             "totalPages": paginator.num_pages,
@@ -244,25 +357,29 @@ class SubunitBussinessView(APIView):
         }
 
         return response(rest_status.HTTP_200_OK,
-                        data=paginator.page(page).object_list,
+                        data=SubunitBussinessSerializers(paginator.page(page).object_list, many=True).data,
                         message="Subunit Bussiness",
                         meta=meta,
                         status=True)
 
-    def get_all_by_account(self, account_id, page, limit):
+    def get_all_by_account(self, account_id, page, limit, cursor=''):
         try:
-            token = get_token_data(self.request.META, key=None, all=True)
+            token = get_auth_context(self.request)
             if 'accountId' in token and token['accountId'] != account_id:
                 return response(rest_status.HTTP_200_OK, data=[], message=DATA_NOT_FOUND)
-            units = Department.objects.filter(type='SUBUNIT', account_id=account_id).order_by("name")
-            paginator = Paginator(units, limit)
-            serializer = SubunitBussinessSerializers(paginator.page(page), many=True)
-            meta = {
-                "totalRecords": paginator.count,
-                "totalPages": paginator.num_pages,
-                "page": page,
-                "limit": limit
-            }
+            units = Department.objects.filter(type='SUBUNIT', account_id=account_id)
+            if cursor:
+                units, meta = keyset_page(units, cursor, limit)
+                serializer = SubunitBussinessSerializers(units, many=True)
+            else:
+                paginator = Paginator(units.order_by("name", "id"), limit)
+                serializer = SubunitBussinessSerializers(paginator.page(page), many=True)
+                meta = {
+                    "totalRecords": paginator.count,
+                    "totalPages": paginator.num_pages,
+                    "page": page,
+                    "limit": limit
+                }
             data = serializer.data if serializer.data else []
             meta_data = meta if serializer.data else None
             message = "Get Sub Unit Bussiness" if serializer.data else DATA_NOT_FOUND
@@ -271,7 +388,7 @@ class SubunitBussinessView(APIView):
             return response(rest_status.HTTP_200_OK, data=[], message=DATA_NOT_FOUND)
 
     def is_allowed(self, account_id):
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
         if token.get('iss') != settings.JWT_ISSUER:
             return True
 
@@ -292,15 +409,29 @@ class SubunitBussinessView(APIView):
         return response(rest_status.HTTP_400_BAD_REQUEST, message=str(e))
 
 
+def keyset_page(queryset, cursor, limit):
+    # cursor pagination on primary key, deep pages cost the same as the first one
+    cursor = int(cursor)
+    rows = list(queryset.filter(id__gt=cursor).order_by('id')[:limit + 1])
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    meta = {
+        "cursor": cursor,
+        "nextCursor": next_cursor,
+        "limit": limit
+    }
+    return rows[:limit], meta
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class DepartmentView(APIView):
     @partial(loginRequired, module="ACCOUNT", access="MANAGE")
     def post(self, request, acc_id=''):
 
         if request.method == 'POST':
-            account_id_token = get_token_data(request._request.META, 'accountId')
-            super_admin = get_token_data(request._request.META, 'isSuperAdmin')
-            is_cms = True if get_token_data(request.META, 'iss') != settings.JWT_ISSUER else False
+            auth_context = get_auth_context(request)
+            account_id_token = auth_context.get('accountId')
+            super_admin = auth_context.get('isSuperAdmin')
+            is_cms = True if auth_context.get('iss') != settings.JWT_ISSUER else False
 
             # bulk create
             if acc_id != '':
@@ -308,7 +439,7 @@ class DepartmentView(APIView):
                 check_access = check_access_account(account_id_token=account_id_token, super_admin=super_admin,
                                                     account_id=acc_id, is_cms=is_cms)
 
-                if check_access is False or get_token_data(request._request.META, 'isAdmin') is False:
+                if check_access is False or auth_context.get('isAdmin') is False:
                     return response(400, message='Unauthorized')
 
                 return bulk_create(request, acc_id)
@@ -343,8 +474,8 @@ class DepartmentView(APIView):
                     res = restructure_json(serializer.data)
 
                     # insert log activity
-                    insert_log_activity(log_from='department', old='', new=serializer.data, type='create',
-                                        request=request)
+                    log_activity(log_from='department', old='', new=serializer.data, type='create',
+                                 request=request)
 
                     transaction.savepoint_commit(sid)
                     return response(201, res, message, status)
@@ -358,7 +489,7 @@ class DepartmentView(APIView):
     def get(self, request, id=''):
         meta = None
         try:
-            token = get_token_data(self.request.META, key=None, all=True)
+            token = get_auth_context(self.request)
             is_admin = token['isAdmin'] if 'isAdmin' in token and token['isAdmin'] else False
             is_super_admin = token['isSuperAdmin'] if 'isSuperAdmin' in token and token['isSuperAdmin'] else False
             is_parent = token['isParent'] if 'isParent' in token and token['isParent'] else False
@@ -400,64 +531,8 @@ class DepartmentView(APIView):
                             keywords &= Q(account_id=account_id)
 
                 nonstrict()
-                list_department = Department.objects.filter(keywords) \
-                    .annotate(
-                        total_contact_account_req=Subquery(
-                            AccountContact.objects.filter(
-                                department_id=OuterRef('pk'), is_disabled=False).values("department_id")
-                                .annotate(total=Count("contact")).values("total")[:1], IntegerField()
-                        ),
-                        total_contact_requestor=Subquery(
-                            ContactDepartmentRequestor.objects.filter(
-                                department_id=OuterRef('pk')).exclude(
-                                contact_id__in=Subquery(
-                                AccountContact.objects.filter(
-                                    department_id=OuterRef('department_id'),
-                                    is_disabled=False
-                                ).values_list("contact_id", flat=True)
-                                ))
-                                .order_by("department").values("department")
-                                .annotate(total=Count("department")).values("total")[:1], IntegerField()
-                        ),
-                        total_contact_approver=Subquery(
-                            ContactDepartmentApproval.objects.filter(
-                                department_id=OuterRef('pk')
-                            ).exclude(contact_id__in=Subquery(
-                                AccountContact.objects.filter(
-                                    department_id=OuterRef('department_id'),
-                                    is_disabled=False
-                                ).values_list("contact_id", flat=True))
-                            ).order_by("department").values("department")
-                            .annotate(total=Count("department")).values("total")[:1], IntegerField()
-                        ),
-                        total_contact=Case(
-                            When(total_contact_approver__isnull=False, total_contact_requestor__isnull=False,
-                                 total_contact_account_req__isnull=False,
-                                 then=F('total_contact_approver') + F('total_contact_requestor') +
-                                      F('total_contact_account_req')),
-                            When(total_contact_approver__isnull=False, total_contact_requestor__isnull=False,
-                                 total_contact_account_req__isnull=True,
-                                 then=F('total_contact_approver') + F('total_contact_requestor')),
-                            When(total_contact_approver__isnull=True, total_contact_requestor__isnull=False,
-                                 total_contact_account_req__isnull=False,
-                                 then=F('total_contact_requestor') + F('total_contact_account_req')),
-                            When(total_contact_approver__isnull=False, total_contact_requestor__isnull=True,
-                                 total_contact_account_req__isnull=False,
-                                 then=F('total_contact_approver') + F('total_contact_account_req')),
-                            When(total_contact_approver__isnull=False, total_contact_requestor__isnull=True,
-                                 total_contact_account_req__isnull=True,
-                                 then=F('total_contact_approver')),
-                            When(total_contact_approver__isnull=True, total_contact_requestor__isnull=False,
-                                 total_contact_account_req__isnull=True,
-                                 then=F('total_contact_requestor')),
-                            When(total_contact_approver__isnull=True, total_contact_requestor__isnull=True,
-                                 total_contact_account_req__isnull=False,
-                                 then=F('total_contact_account_req')),
-                            default=F('total_contact_requestor')
-                        )
-                    ).order_by(sorting)
-
-                paginator = Paginator(list_department, limit)
+                list_department = Department.objects.filter(keywords)
+                paginator = Paginator(annotate_total_contact(list_department).order_by(sorting), limit)
 
                 res = departmentSerializers(paginator.page(page), many=True)
 
@@ -468,7 +543,7 @@ class DepartmentView(APIView):
                     "totalRecords": paginator.count
                 }
 
-                clean_data = list(map(lambda item: restructure_json(item), res.data))
+                clean_data = restructure_json_list(res.data)
             else:
                 try:
                     if not is_passed_IDOR_check(token, id):
@@ -547,7 +622,7 @@ class DepartmentView(APIView):
         }, departments))
 
     def get_account_contact(self, account_id):
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
         if token.get('iss') != settings.JWT_ISSUER:
             return None, account_id, None
 
@@ -566,7 +641,7 @@ class DepartmentView(APIView):
 
     @partial(loginRequired, module="ACCOUNT", access="MANAGE")
     def put(self, request, id=''):
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
         data = JSONParser().parse(request)
         if not is_passed_IDOR_check(token, id):
             return response(rest_status.HTTP_401_UNAUTHORIZED, message="Unauthorized")
@@ -613,8 +688,8 @@ class DepartmentView(APIView):
                     return response(400, message="Failed update department. {}".format(err))
             serializer.save()
             res = restructure_json(serializer.data)
-            insert_log_activity(log_from='department', old=get_department.data, new=serializer.data, type='update',
-                                request=request)
+            log_activity(log_from='department', old=get_department.data, new=serializer.data, type='update',
+                         request=request)
             transaction.savepoint_commit(sid)
 
             return response(201, res, message="Success update department", status=True)
@@ -629,32 +704,147 @@ class DepartmentView(APIView):
 
         return response(200, message="no action")
 
+
+def annotate_total_contact(queryset):
+    # total contact = account contact + requestor + approver which is not listed as account contact,
+    # NULL when department has no contact at all
+    return queryset.annotate(
+        total_contact_account_req=Subquery(
+            AccountContact.objects.filter(
+                department_id=OuterRef('pk'), is_disabled=False).values("department_id")
+            .annotate(total=Count("contact")).values("total")[:1], IntegerField()
+        ),
+        total_contact_requestor=Subquery(
+            ContactDepartmentRequestor.objects.filter(
+                department_id=OuterRef('pk')).exclude(
+                contact_id__in=Subquery(
+                    AccountContact.objects.filter(
+                        department_id=OuterRef('department_id'),
+                        is_disabled=False
+                    ).values_list("contact_id", flat=True)
+                ))
+            .order_by("department").values("department")
+            .annotate(total=Count("department")).values("total")[:1], IntegerField()
+        ),
+        total_contact_approver=Subquery(
+            ContactDepartmentApproval.objects.filter(
+                department_id=OuterRef('pk')
+            ).exclude(contact_id__in=Subquery(
+                AccountContact.objects.filter(
+                    department_id=OuterRef('department_id'),
+                    is_disabled=False
+                ).values_list("contact_id", flat=True))
+            ).order_by("department").values("department")
+            .annotate(total=Count("department")).values("total")[:1], IntegerField()
+        ),
+        total_contact=NullIf(
+            Coalesce(F('total_contact_approver'), Value(0)) + Coalesce(F('total_contact_requestor'), Value(0)) +
+            Coalesce(F('total_contact_account_req'), Value(0)),
+            Value(0)
+        )
+    )
+
+
+def log_activity(request=None, **kwargs):
+    # written once the surrounding transaction commits (nothing on rollback), still in the request thread:
+    # insert_log_activity reads the user & token of the live request, nothing of it is kept afterwards
+    transaction.on_commit(lambda: write_log_activity(request, kwargs))
+
+
+def write_log_activity(request, entry):
+    # the data change is already committed, a failed audit entry is logged with its payload instead of raising
+    try:
+        insert_log_activity(request=request, **entry)
+    except Exception as e:
+        log.error("activity log %s/%s not written: %s %s", entry.get('log_from'), entry.get('type'), e, entry)
+
+
 def is_passed_IDOR_check(token, id=''):
     # Penjagaan IDOR Attack by DB Checking
     if not token.get('iss') == settings.JWT_ISSUER:
         return True
 
-    search_contact = Q(id=token['contactId'], email=token['email'], is_disabled=False)
-    is_valid_contact = Contact.objects.origin_query().filter(search_contact).first()
-    if not is_valid_contact:
-        return False
+    cache_key = 'department-idor:{}:{}:{}:{}:{}'.format(
+        idor_cache_version(), token['contactId'], idor_cache_version(token['contactId']), token['email'], id)
+    is_passed = cache.get(cache_key)
+    if is_passed is None:
+        is_passed = check_department_access(token, id)
+        cache.set(cache_key, is_passed, IDOR_CACHE_TIMEOUT)
+    return is_passed
+
 
-    account_contact = AccountContact.objects.origin_query().filter(contact_id=is_valid_contact.id, is_delete=False).values('account_id', 'is_admin')
-    accounts = [x.get('account_id') for x in account_contact]
-    is_admin = [x.get('is_admin') for x in account_contact]
+def check_department_access(token, id):
+    # active contact of the token, with its account & admin flag
+    account_contact = list(AccountContact.objects.origin_query().filter(
+        contact_id=token['contactId'], contact__email=token['email'], contact__is_disabled=False, is_delete=False
+    ).values_list('account_id', 'is_admin'))
 
-    if not accounts:
+    if not account_contact:
         return False
 
-    if True in is_admin:
+    if True in [is_admin for _, is_admin in account_contact]:
         return True
 
-    dbdata = Department.objects.filter(account_id__in=accounts).values('id')
-    dept_list = [data.get('id') for data in dbdata]
+    accounts = [account_id for account_id, _ in account_contact]
+    return Department.objects.filter(id=int(id), account_id__in=accounts).exists()
+
+
+def idor_cache_version(contact_id=None):
+    key = IDOR_CACHE_VERSION if contact_id is None else '{}:{}'.format(IDOR_CACHE_VERSION, contact_id)
+    return cache_version(key)
+
+
+def reset_idor_cache(contact_id=None):
+    key = IDOR_CACHE_VERSION if contact_id is None else '{}:{}'.format(IDOR_CACHE_VERSION, contact_id)
+    bump_cache_version(key)
+    # bump again after commit, so an access computed from the uncommitted rows is not kept
+    transaction.on_commit(lambda: bump_cache_version(key))
+
+
+def cache_version(key):
+    # seeded from the clock, an evicted version key never comes back to a value used before
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+def bump_cache_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # nothing cached yet for this key
+        pass
+
+
+def get_account_family(account_id):
+    # account id with its child account ids, shared by every account IDOR check of this module
+    cache_key = 'account-family:{}:{}'.format(cache_version(ACCOUNT_FAMILY_CACHE_VERSION), account_id)
+    account_family = cache.get(cache_key)
+    if account_family is None:
+        account_family = frozenset(Account.objects.origin_query().filter(
+            Q(id=account_id) | Q(parent_id=account_id)).values_list('id', flat=True))
+        cache.set(cache_key, account_family, ACCOUNT_FAMILY_CACHE_TIMEOUT)
+    return account_family
+
+
+@receiver([post_save, post_delete], sender=Department)
+def reset_department_idor_cache(sender, instance, **kwargs):
+    reset_idor_cache()
+
+
+@receiver([post_save, post_delete], sender=AccountContact)
+def reset_account_contact_idor_cache(sender, instance, **kwargs):
+    reset_idor_cache(instance.contact_id)
+
+
+@receiver([post_save, post_delete], sender=Contact)
+def reset_contact_idor_cache(sender, instance, **kwargs):
+    reset_idor_cache(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Account)
+def reset_account_family_cache(sender, instance, **kwargs):
+    bump_cache_version(ACCOUNT_FAMILY_CACHE_VERSION)
+    transaction.on_commit(lambda: bump_cache_version(ACCOUNT_FAMILY_CACHE_VERSION))
 
-    if int(id) not in dept_list:
-        return False
-    return True
 
 def update_order(data, approval_number, id):
     # nilai `old` dan `new` tidak boleh 0
@@ -678,53 +868,95 @@ def update_order(data, approval_number, id):
     approvals_by_department = ContactDepartmentApproval.objects.filter(department_id=id)
     if data["approvalNumber"] == 0:
         approvals_by_department.delete()
-    else:    
-        for order in data["order"]:
-            approvals_by_department.filter(order=order["old"]).update(order=order["new"])
+    elif data["order"]:
+        # one UPDATE for the whole old -> new mapping, every row reads its old order so swaps are safe
+        approvals_by_department.filter(order__in=[order["old"] for order in data["order"]]).update(order=Case(
+            *[When(order=order["old"], then=Value(order["new"])) for order in data["order"]],
+            default=F('order'),
+            output_field=IntegerField()
+        ))
+    reset_approval_chain(id)
 
     return None
 
 
+def get_approval_chains(department_ids):
+    # read-only {order: (contact id, ...)} per department, loaded with one ordered query and cached
+    # until the approvers of the department change
+    cache_keys = {department_id: APPROVAL_CHAIN_CACHE_KEY.format(department_id) for department_id in department_ids}
+    cached = cache.get_many(list(cache_keys.values()))
+    chains = {department_id: cached[key] for department_id, key in cache_keys.items() if key in cached}
+
+    missing = [department_id for department_id in cache_keys if department_id not in chains]
+    if missing:
+        levels = {department_id: defaultdict(list) for department_id in missing}
+        approvals = ContactDepartmentApproval.objects.filter(department_id__in=missing).order_by("order") \
+            .values_list('department_id', 'order', 'contact_id')
+        for department_id, order, contact_id in approvals:
+            levels[department_id][order].append(contact_id)
+
+        loaded = {department_id: tuple((order, tuple(contact_ids)) for order, contact_ids in level.items())
+                  for department_id, level in levels.items()}
+        cache.set_many({cache_keys[department_id]: chain for department_id, chain in loaded.items()},
+                       APPROVAL_CHAIN_CACHE_TIMEOUT)
+        chains.update(loaded)
+
+    return {department_id: MappingProxyType(dict(chain)) for department_id, chain in chains.items()}
+
+
+def reset_approval_chain(*department_ids):
+    keys = [APPROVAL_CHAIN_CACHE_KEY.format(department_id) for department_id in department_ids]
+    cache.delete_many(keys)
+    # drop again after commit, so a chain read before commit is not kept
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver([post_save, post_delete], sender=ContactDepartmentApproval)
+def reset_approval_link_chain(sender, instance, **kwargs):
+    # approvers changed outside of this module, cascade delete of a contact included
+    reset_approval_chain(instance.department_id)
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class SubDepartmentContactView(APIView):
     @partial(loginRequired, module="ACCOUNT", access="VIEW")
     def get(self, request, dept_id=0):
         try:
             search = request.GET.get('search', '')
+            page = int(request.GET.get('page', 1))
+            limit = int(request.GET.get('limit', 20))
+            cursor = request.GET.get('cursor', '')
 
             try:
                 nonstrict()
-                detail_department = Department.objects\
-                    .annotate(
-                        total_contact_requestor=Subquery(
-                            ContactDepartmentRequestor.objects.filter(
-                                department_id=OuterRef('pk')).order_by("department").values("department") \
-                                .annotate(total=Count("department")).values("total")[:1], IntegerField()
-                        ),
-                        total_contact_approver=Subquery(
-                            ContactDepartmentApproval.objects.filter(
-                                department_id=OuterRef('pk')).order_by("department").values("department") \
-                                .annotate(total=Count("department")).values("total")[:1], IntegerField()
-                        ),
-                        total_contact=F('total_contact_approver') + F('total_contact_requestor')
-                    )\
-                    .get(pk=dept_id)
+                detail_department = Department.objects.values('id', 'account_id', 'approval_number').get(pk=dept_id)
             except Department.DoesNotExist:
                 return response(404, message="Subdepartment doesn't exists")
 
-            # finalizing data
-            serializer_department = departmentSerializers(detail_department)
-            clean_data = restructure_json_nonapprover(item=serializer_department.data, id=dept_id, search=search)
-            if clean_data:
-                limit_rows = 20
-                total_rows = len(clean_data)
+            contacts = department_contact_queryset(detail_department, search)
+            if cursor:
+                rank, contact_id = [int(value) for value in cursor.split(':')]
+                rows = list(contacts.filter(Q(rank__gt=rank) | Q(rank=rank, id__gt=contact_id))[:limit + 1])
                 meta = {
-                    "totalRecords": total_rows,
-                    "totalPages": math.ceil(total_rows / limit_rows),
-                    "page": 1,
-                    "limit": limit_rows
+                    "cursor": cursor,
+                    "nextCursor": '{}:{}'.format(rows[limit - 1]['rank'], rows[limit - 1]['id'])
+                    if len(rows) > limit else None,
+                    "limit": limit
+                }
+                rows = rows[:limit]
+            else:
+                paginator = Paginator(contacts, limit)
+                rows = paginator.page(page).object_list
+                meta = {
+                    "totalRecords": paginator.count,
+                    "totalPages": paginator.num_pages,
+                    "page": page,
+                    "limit": limit
                 }
 
+            # finalizing data
+            clean_data = [ContactSummary(*[row[field] for field in ContactSummary.__slots__]).to_json() for row in rows]
+            if clean_data:
                 return response(200, data=clean_data, message="Get Subdepartment contact list", status=True, meta=meta)
             else:
                 return response(200, data=[], message='Data not found', status=True)
@@ -733,6 +965,138 @@ class SubDepartmentContactView(APIView):
             return response(400, message=str(e))
 
 
+def department_contact_queryset(department, search=''):
+    # account users outside the department first (rank 0-2), then requestors (rank 3-5), then the other
+    # department contacts (rank 6-8), each group ordered by search match (exact, prefix, substring);
+    # approvers are left out, one ordered query the database can page
+    approver_ids = ContactDepartmentApproval.objects.filter(
+        department_id=department['id'], order__gte=1, order__lte=department['approval_number'] or 0
+    ).values('contact_id')
+    requestor_ids = ContactDepartmentRequestor.objects.filter(department_id=department['id']).values('contact_id')
+    department_contact_ids = AccountContact.objects.filter(
+        account=department['account_id'], department_id=department['id'], is_disabled=False
+    ).exclude(contact_id__in=approver_ids).exclude(contact_id__in=requestor_ids).values('contact_id')
+    user_ids = AccountContact.objects.filter(
+        status__in=[Account.ACTIVATED, AccountContact.STATUS_REGISTERED], account=department['account_id'],
+        is_disabled=False
+    ).exclude(contact_id__in=approver_ids).exclude(contact_id__in=requestor_ids) \
+        .exclude(contact_id__in=department_contact_ids).values('contact_id')
+
+    search_filter, search_rank = contact_search_filter(department['account_id'], search)
+    group_rank = Case(
+        When(id__in=requestor_ids, then=Value(3)),
+        When(id__in=department_contact_ids, then=Value(6)),
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+    return Contact.objects.filter(search_filter) \
+        .filter(Q(id__in=requestor_ids) | Q(id__in=department_contact_ids) | Q(id__in=user_ids)) \
+        .annotate(rank=group_rank + search_rank).order_by('rank', 'id').values('rank', *ContactSummary.__slots__)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DepartmentSearchView(APIView):
+    @partial(loginRequired, module="ACCOUNT", access="VIEW")
+    def get(self, request):
+        account_id = replaceAccountId(request.GET.get('accountId', ''))
+        search = request.GET.get('search', '')
+        page = int(request.GET.get('page', 1))
+        limit = int(request.GET.get('limit', 10))
+
+        if not account_id or not search:
+            return response(400, message="Field accountId and search are required")
+
+        if not self.is_allowed(account_id):
+            return response(rest_status.HTTP_401_UNAUTHORIZED, message="Unauthorized")
+
+        paginator = Paginator(search_department_queryset(account_id, search), limit)
+        meta = {
+            "page": page,
+            "limit": limit,
+            "totalPages": paginator.num_pages,
+            "totalRecords": paginator.count
+        }
+        data = [restructure_search_json(item) for item in paginator.page(page).object_list]
+        if not data:
+            return response(200, data=[], message=DATA_NOT_FOUND, status=True)
+
+        return response(200, data=data, message="Search department", status=True, meta=meta)
+
+    def is_allowed(self, account_id):
+        token = get_auth_context(self.request)
+        if token.get('iss') != settings.JWT_ISSUER:
+            return True
+
+        return int(account_id) in get_account_family(token.get('accountId'))
+
+    def handle_exception(self, exc):
+        log.error(exc)
+        return response(400, message=str(exc))
+
+
+def search_department_queryset(account_id, search):
+    # department, unit & subunit of an account ranked exact code, prefix then substring,
+    # with parent unit & department names joined in the same query; matched by pg_trgm when enabled,
+    # else from the department search index when the term has a trigram & the hit list is small
+    nonstrict()
+    departments = Department.objects.filter(
+        account_id=account_id, type__in=[Department.TYPE_DEPARTMENT, Department.TYPE_UNIT, Department.TYPE_SUBUNIT]
+    )
+    trigram = SEARCH_TRIGRAM and connection.vendor == 'postgresql'
+
+    # no hit from the index is confirmed by the database
+    ranked = None if trigram else department_search_index.search(account_id, search)
+    if ranked and len(ranked) <= DEPARTMENT_SEARCH_INDEX_MAX_HITS:
+        search_filter, search_rank = ranked_search_filter(ranked)
+    else:
+        search_filter = Q(code__icontains=search) | Q(name__icontains=search)
+        search_rank = Case(
+            When(code__iexact=search, then=Value(0)),
+            When(Q(code__istartswith=search) | Q(name__istartswith=search), then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField()
+        )
+    departments = departments.filter(search_filter).annotate(rank=search_rank)
+
+    ordering = ['rank']
+    if trigram:
+        # needs pg_trgm, a gin_trgm_ops index on code & name serves the icontains filter
+        departments = departments.annotate(similarity=TrigramSimilarity('name', search))
+        ordering.append('-similarity')
+
+    return departments.order_by(*ordering, 'code', 'id').values(
+        'id', 'account_id', 'code', 'name', 'type', 'parent_id', 'parent__name', 'parent__parent_id',
+        'parent__parent__name')
+
+
+def restructure_search_json(item):
+    department_parent = ""
+    unit_parent = ""
+    department_id = item['id']
+    unit_id = None
+    if item['type'] == Department.TYPE_SUBUNIT:
+        unit_parent = item['parent__name']
+        department_parent = item['parent__parent__name']
+        unit_id = item['parent_id']
+        department_id = item['parent__parent_id']
+    elif item['type'] == Department.TYPE_UNIT:
+        department_parent = item['parent__name']
+        department_id = item['parent_id']
+
+    return {
+        "id": item['id'],
+        "accountId": item['account_id'],
+        "code": item['code'],
+        "name": item['name'],
+        "type": item['type'],
+        "unit": unit_parent,
+        "unitId": unit_id,
+        "department": department_parent,
+        "departmentId": department_id
+    }
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class ContactInvite(APIView):
     def post(self, request, id='', *args, **kwargs):
@@ -752,20 +1116,21 @@ class DepartmentInviteContact(APIView):
 
 
 def department_invite_contact(request, id_department):
-    account_id_token = get_token_data(request._request.META, 'accountId')
-    super_admin = get_token_data(request._request.META, 'isSuperAdmin')
+    auth_context = get_auth_context(request)
+    account_id_token = auth_context.get('accountId')
+    super_admin = auth_context.get('isSuperAdmin')
     data = JSONParser().parse(request)
     data['departmentId'] = id_department
     account_id = setDefaultValue("accountId", data, '')
 
     # user cms
-    is_cms = True if get_token_data(request.META, 'iss') != settings.JWT_ISSUER else False
+    is_cms = True if auth_context.get('iss') != settings.JWT_ISSUER else False
 
     # check authorized parent account
     check_access = check_access_account(account_id_token=account_id_token, super_admin=super_admin,
                                         account_id=account_id, is_cms=is_cms)
 
-    if check_access is False or get_token_data(request._request.META, 'isAdmin') is False:
+    if check_access is False or auth_context.get('isAdmin') is False:
         return response(400, message='Unauthorized')
 
     sid = transaction.savepoint()
@@ -778,17 +1143,12 @@ def department_invite_contact(request, id_department):
         nonstrict()
         department = Department.objects.get(id=data['departmentId'], account=account_id)
 
-        temp_approver_exist = []
-        approver = ContactDepartmentApproval.objects.filter(department_id=data['departmentId']).distinct()
-        if approver.count() > 0:
-            for approver in approver:
-                temp_approver_exist.append(approver.contact_id)
+        temp_approver_exist = list(ContactDepartmentApproval.objects.filter(department_id=data['departmentId'])
+                                   .values_list('contact_id', flat=True))
 
-        temp_contact_id = []
-        requestor = ContactDepartmentRequestor.objects.filter(department_id=data['departmentId']).distinct()
-        if requestor.count() > 0:
-            for requestor in requestor:
-                temp_contact_id.append(requestor.contact_id)
+        temp_contact_id = list(ContactDepartmentRequestor.objects.filter(department_id=data['departmentId'])
+                               .values_list('contact_id', flat=True))
+        existing_requestor = set(temp_contact_id)
 
         set_requester_new_value = list(set(data['requestor']) - set(temp_contact_id))
         set_approval_new_value = approver_new_value(data, temp_approver_exist)
@@ -807,12 +1167,23 @@ def department_invite_contact(request, id_department):
                 transaction.savepoint_rollback(sid)
                 return response(400, message="Minimum requestor contact is 1")
             else:
+                # membership of every requestor & approver in the account, resolved with one query
+                requestor_member = defaultdict(list)
+                approver_member = set()
+                approver_contact_ids = [con_id for cont in data.get('approver', [])
+                                        for con_id in cont.get('contactId', [])]
+                account_contact = AccountContact.objects.filter(
+                    account_id=account_id, contact_id__in=set(contact_id_list + approver_contact_ids))
+                for con_id, is_disabled in account_contact.values_list('contact_id', 'is_disabled'):
+                    approver_member.add(con_id)
+                    if not is_disabled:
+                        requestor_member[con_id].append(con_id)
+
                 # if email already in contact
                 res = ""
+                new_requestor = []
                 for contact_id in contact_id_list:
-                    contact_list = AccContactSerializer(
-                        AccountContact.objects.filter(contact=contact_id, account_id=account_id, is_disabled=False),
-                        many=True).data
+                    contact_list = requestor_member[contact_id]
 
                     if len(contact_list) == 0:
                         error = True
@@ -823,21 +1194,21 @@ def department_invite_contact(request, id_department):
                         break
 
                     for con_id in contact_list:
-                        if con_id['contact'] in set(temp_approver_exist):
+                        if con_id in set(temp_approver_exist):
                             error = True
                             res = response(400, message="Contact from your requestor list already used as approver")
                             break
 
-                        clean_data_bulk = structure_json_requestor(department.id, con_id['contact'])
-                        serializer_requestor = ContactDeptRequestorSerializer(data=clean_data_bulk)
-                        if not serializer_requestor.is_valid():
-                            res = response(400, message=serializer_requestor.errors)
-                            error = True
-                            break
+                        if con_id not in existing_requestor:
+                            new_requestor.append(
+                                ContactDepartmentRequestor(**structure_json_requestor(department.id, con_id)))
+                            existing_requestor.add(con_id)
 
-                        contact_id_requestor.append(con_id['contact'])
-                        temp_contact_id.append(con_id['contact'])
-                        serializer_requestor.update_or_create()
+                        contact_id_requestor.append(con_id)
+                        temp_contact_id.append(con_id)
+
+                if not error:
+                    ContactDepartmentRequestor.objects.bulk_create(new_requestor)
 
             if error:
                 transaction.savepoint_rollback(sid)
@@ -845,6 +1216,7 @@ def department_invite_contact(request, id_department):
 
             # set approver
             approver_list = []
+            approval_links = {}
             if department.approval_number:
                 if department.approval_number != len(data['approver']):
                     transaction.savepoint_rollback(sid)
@@ -886,31 +1258,30 @@ def department_invite_contact(request, id_department):
                                 break
 
                             for con_id in list_contact_id:
-                                AccountContact.objects.get(contact_id=con_id, account_id=account_id)
-                                clean_data_bulk_app = structure_json_approval(department.id, con_id, order)
-                                serializer_approver = ContactDeptApprovalSerializer(data=clean_data_bulk_app)
-
-                                if not serializer_approver.is_valid():
-                                    res = response(400, message=serializer_approver.errors)
-                                    error = True
-                                    break
+                                if con_id not in approver_member:
+                                    raise AccountContact.DoesNotExist()
 
                                 approver_id.append(con_id)
-                                serializer_approver.update_or_create()
+                                approval_links[(department.id, con_id)] = order
 
                             approver_list.append({"contactId": approver_id, "order": order})
 
+                    if not error:
+                        save_approval_links(approval_links)
+
             item_res = {"id": id_department, "approver": approver_list, "requestor": contact_id_requestor}
             res_data.append(item_res)
 
             if not error:
                 # insert log activity
-                insert_log_activity(log_from='department', old='', new=res_data[0], type='assign',
-                                    request=request)
+                log_activity(log_from='department', old='', new=res_data[0], type='assign',
+                             request=request)
 
-                for contact_id in (set_requester_new_value + set_approval_new_value):
+                invited_contact_ids = set_requester_new_value + set_approval_new_value
+                if invited_contact_ids:
                     member_type = department.account.member_type
-                    send_invitation_department(contact_id, department.name, member_type=member_type)
+                    for contact_id in invited_contact_ids:
+                        enqueue_mail('invitation-department', contact_id, department.name, member_type=member_type)
 
                 res = response(201, data=res_data, message="Assign requestor & approval success", status=True)
 
@@ -936,6 +1307,33 @@ def department_invite_contact(request, id_department):
     return res
 
 
+def save_approval_links(approval_links):
+    # bulk insert-or-update of approver order keyed by (department id, contact id)
+    if not approval_links:
+        return
+
+    department_ids = {department_id for department_id, _ in approval_links}
+    contact_ids = {contact_id for _, contact_id in approval_links}
+    existing = {}
+    for approval in ContactDepartmentApproval.objects.filter(department_id__in=department_ids,
+                                                             contact_id__in=contact_ids):
+        if (approval.department_id, approval.contact_id) in approval_links:
+            existing[(approval.department_id, approval.contact_id)] = approval
+
+    updated = []
+    for key, approval in existing.items():
+        if approval.order != approval_links[key]:
+            approval.order = approval_links[key]
+            updated.append(approval)
+
+    ContactDepartmentApproval.objects.bulk_update(updated, ['order'])
+    ContactDepartmentApproval.objects.bulk_create([
+        ContactDepartmentApproval(**structure_json_approval(department_id, contact_id, order))
+        for (department_id, contact_id), order in approval_links.items() if (department_id, contact_id) not in existing
+    ])
+    reset_approval_chain(*department_ids)
+
+
 def approver_new_value(request_data, current_approver):
     approver_data = []
     try:
@@ -950,38 +1348,294 @@ def approver_new_value(request_data, current_approver):
     return approver_list
 
 
-def send_invitation_department(contact_id, department_name, member_type=''):
-    if contact_id == 0:
-        return None
+class CacheQueue:
+    """Best-effort work queue kept in the Django cache, drained by the processes sharing that cache.
+
+    It is not durable: a message evicted by the cache, or never pushed because the process stopped between the
+    commit and the push, is lost (a skipped message is logged). It needs a cache shared by the processes, with
+    LocMemCache every process only sees its own messages.
+
+    Messages are numbered by an atomic sequence. A worker claims a message with a lease right before handling it,
+    so a message is not handled twice at the same time, and the claimed message of a stopped worker is handled
+    again once its lease expires, as long as the cache still holds it.
+    """
+
+    def __init__(self, name, handler, executor, claim=1, window=200, lease=300, timeout=60 * 60 * 24 * 7,
+                 retries=MAIL_RETRIES, retry_delay=MAIL_RETRY_DELAY, on_drop=None):
+        self.name = name
+        # handler(messages) -> error (or None) per message
+        self.handler = handler
+        self.executor = executor
+        self.claim = claim
+        self.window = window
+        self.lease = lease
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_drop = on_drop
+
+    def key(self, sequence):
+        return '{}:{}'.format(self.name, sequence)
+
+    def push(self, message):
+        cache.add(self.key('sequence'), 0, None)
+        sequence = cache.incr(self.key('sequence'))
+        cache.set(self.key(sequence), dict(message, sequence=sequence, attempts=0, retryAt=0), self.timeout)
+        self.wake()
+
+    def wake(self):
+        # nothing drains at import: messages left by another process are picked up by the next push or poll
+        self.executor.submit(self.drain)
+
+    def extend(self, message):
+        # a long running handler keeps its claim while it makes progress
+        cache.set(self.key(message['sequence']) + ':claim', 1, self.lease)
+
+    def drain(self):
+        try:
+            while self.drain_batch():
+                pass
+        except Exception as e:
+            log.error(e)
+        finally:
+            connection.close()
+
+    def drain_batch(self):
+        # handle up to `claim` due messages of the window, returns True while there is more to do
+        head = cache.get(self.key('head'), 1)
+        last = min(cache.get(self.key('sequence'), 0), head + self.window - 1)
+        keys = {sequence: self.key(sequence) for sequence in range(head, last + 1)}
+        if not keys:
+            return False
+
+        messages = cache.get_many(list(keys.values()))
+        claimed = {}
+        missing = []
+        next_head = None
+        retry_at = None
+        now = time.time()
+        for sequence, key in keys.items():
+            message = messages.get(key)
+            if message is None:
+                # pushed but not written yet, or evicted: skipped once it stays missing for a whole lease
+                if now - cache.get_or_set(key + ':missing', now, self.timeout) <= self.lease:
+                    next_head = next_head or sequence
+                else:
+                    missing.append(sequence)
+                continue
+            if message.get('done'):
+                continue
+
+            next_head = next_head or sequence
+            if message['retryAt'] > now:
+                retry_at = min(retry_at or message['retryAt'], message['retryAt'])
+            elif len(claimed) < self.claim and cache.add(key + ':claim', 1, self.lease):
+                claimed[key] = message
+        cache.set(self.key('head'), max(next_head or last + 1, head), None)
+        skipped = [sequence for sequence in missing if sequence < (next_head or last + 1)]
+        if skipped:
+            log.warning("%s messages %s are missing from the cache, skipped", self.name, skipped)
+
+        errors = self.handler(list(claimed.values())) if claimed else []
+        for (key, message), error in zip(claimed.items(), errors):
+            if error is None:
+                cache.set(key, {"done": True}, self.timeout)
+            elif message['attempts'] + 1 >= self.retries:
+                log.error("%s message dropped after %s attempts: %s", self.name, self.retries, error)
+                if self.on_drop:
+                    self.on_drop(message, error)
+                cache.set(key, {"done": True}, self.timeout)
+            else:
+                log.error(error)
+                message['attempts'] += 1
+                message['retryAt'] = time.time() + self.retry_delay * (2 ** message['attempts'])
+                retry_at = min(retry_at or message['retryAt'], message['retryAt'])
+                cache.set(key, message, self.timeout)
+            cache.delete(key + ':claim')
+
+        # a single pending wake-up for the earliest retry, whatever the number of drains
+        if retry_at and cache.add(self.key('wakeup'), retry_at, max(retry_at - now, 1)):
+            timer = threading.Timer(max(retry_at - now, 0), self.wake)
+            timer.daemon = True
+            timer.start()
+
+        return bool(claimed) or (next_head is None and last < cache.get(self.key('sequence'), 0))
+
+
+def get_job(kind, job_id):
+    return cache.get(JOB_KEY.format(kind, job_id))
+
+
+def save_job(kind, job):
+    cache.set(JOB_KEY.format(kind, job['id']), job, JOB_TIMEOUT)
+
+
+class AccountJobView(APIView):
+    """Background jobs of an account (import, invite), started & polled by the admins of that account."""
+
+    def is_allowed(self, account_id):
+        auth_context = get_auth_context(self.request)
+        is_cms = True if auth_context.get('iss') != settings.JWT_ISSUER else False
+        check_access = check_access_account(account_id_token=auth_context.get('accountId'),
+                                            super_admin=auth_context.get('isSuperAdmin'),
+                                            account_id=account_id, is_cms=is_cms)
+
+        return check_access is not False and auth_context.get('isAdmin') is not False
+
+    def handle_exception(self, exc):
+        log.error(exc)
+        return response(400, message=str(exc))
+
+
+def enqueue_mail(kind, *args, **kwargs):
+    # one outbox message per recipient, written only after the surrounding transaction commits (dropped on rollback)
+    # and delivered by the mail workers, outside of the request
+    # queuedAt is the time the mail reports, whenever it is delivered
+    queued_at = datetime.now()
+    transaction.on_commit(lambda: mail_outbox.push({"kind": kind, "args": args, "kwargs": kwargs,
+                                                    "queuedAt": queued_at}))
+
+
+def deliver_mail_batch(messages):
+    # error (or None) per message, a failure only retries its own recipient
+    batch = MailBatch([message['args'][0] for message in messages if message['kind'] == 'invitation-department'])
+    errors = []
     try:
-        data_contact = ContactSerializers(Contact.objects.get(pk=contact_id)).data
+        for message in messages:
+            try:
+                if message['kind'] in MAIL_BUILDERS:
+                    mail = MAIL_BUILDERS[message['kind']](batch, *message['args'], queued_at=message.get('queuedAt'),
+                                                          **message['kwargs'])
+                    if mail:
+                        batch.send(*mail)
+                else:
+                    MAIL_SENDERS[message['kind']](*message['args'], **message['kwargs'])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    finally:
+        batch.close()
+    return errors
 
-        label, from_email, _, bisnis_label = get_label(member_type=member_type)
 
-        mail = {
-            "subject": f"Anda Telah Diundang Untuk Bergabung Sebagai Pengguna {bisnis_label}",
-            "from_email": from_email,
-            "to": data_contact['email']
-        }
+# the outbox lives in the shared cache, mail pending when a process stops is sent by another one
+mail_outbox = CacheQueue('department-mail-outbox', deliver_mail_batch, mail_executor, claim=MAIL_OUTBOX_BATCH,
+                         window=MAIL_OUTBOX_BATCH, lease=MAIL_OUTBOX_LEASE, timeout=MAIL_OUTBOX_TIMEOUT)
 
-        content = {
-            "headerImage": settings.HEADER_IMG,
-            "headerImageBg": settings.HEADER_IMG_BG,
-            "link": settings.HOST_SHARK_CF,
-            "department": department_name,
-            "name": data_contact['email'],
-            "tanggal": datetime.now().strftime("%d/%m/%Y"),
-            "pukul": datetime.now().strftime("%H:%M:%S"),
-            "label": label,
-            "isCorporate": label == settings.ARONAWA_LABEL
-        }
-    except Exception as e:
-        log.error(e)
+
+def request_context(request):
+    # what a mail or job sent after the request still needs of it: the client address & host headers and the
+    # token claims decoded now, never the raw headers (Authorization, Cookie, environment of the server)
+    http_request = getattr(request, '_request', request)
+    return {
+        "meta": {key: http_request.META[key] for key in REQUEST_CONTEXT_META if key in http_request.META},
+        "claims": dict(get_auth_context(http_request))
+    }
+
+
+def detached_request(context):
+    # stands for a request that is gone: its client & host headers, and the claims get_auth_context returns
+    if context is None:
+        return None
+    request = HttpRequest()
+    request.META = dict(context['meta'])
+    request.auth_context = MappingProxyType(context['claims'])
+    return request
+
+
+def send_invitation(context, invitation, member_type=''):
+    return invitationView.sent_invitation(detached_request(context), invitation, member_type=member_type)
+
+
+class MailBatch:
+    """Mail labels & contact emails shared by the mails of one outbox batch.
+
+    Mail is sent through src.helper.mail.send. With shared_connection (DEPARTMENT_MAIL_BATCH_CONNECTION) the batch
+    renders the template itself and sends an HTML & text EmailMultiAlternatives over one SMTP connection instead,
+    only for deployments where send does nothing more than that.
+    """
+
+    def __init__(self, contact_ids=(), shared_connection=MAIL_BATCH_CONNECTION):
+        self.shared_connection = shared_connection
+        self.connection = None
+        self.templates = {}
+        self.labels = {}
+        self.contact_emails = dict(Contact.objects.filter(pk__in=set(contact_ids)).values_list('id', 'email')) \
+            if contact_ids else {}
+
+    def label(self, member_type=''):
+        if member_type not in self.labels:
+            self.labels[member_type] = get_label(member_type=member_type)
+        return self.labels[member_type]
+
+    def template(self, name):
+        if name not in self.templates:
+            self.templates[name] = get_template(name)
+        return self.templates[name]
+
+    def send(self, mail, content, template):
+        if not self.shared_connection:
+            return send(mail, content, template)
+
+        html = self.template(template).render(content)
+        if self.connection is None:
+            self.connection = get_connection()
+            self.connection.open()
+        message = EmailMultiAlternatives(mail['subject'], strip_tags(html), mail['from_email'], [mail['to']],
+                                         connection=self.connection)
+        message.attach_alternative(html, 'text/html')
+        try:
+            return message.send()
+        except Exception:
+            # reconnect for the next mail of the batch
+            self.close()
+            raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def invitation_department_batch_mail(batch, contact_id, department_name, member_type='', queued_at=None):
+    email = batch.contact_emails.get(contact_id)
+    if email is None:
+        # contact removed meanwhile, nothing to retry
         return None
 
+    return invitation_department_mail(email, department_name, member_type, get_mail_label=batch.label,
+                                      queued_at=queued_at)
+
+
+def change_department_batch_mail(batch, data, queued_at=None):
+    return change_department_mail(data, get_mail_label=batch.label, queued_at=queued_at)
+
+
+def invitation_department_mail(email, department_name, member_type='', get_mail_label=get_label, queued_at=None):
+    queued_at = queued_at or datetime.now()
+    label, from_email, _, bisnis_label = get_mail_label(member_type=member_type)
+
+    mail = {
+        "subject": f"Anda Telah Diundang Untuk Bergabung Sebagai Pengguna {bisnis_label}",
+        "from_email": from_email,
+        "to": email
+    }
+
+    content = {
+        "headerImage": settings.HEADER_IMG,
+        "headerImageBg": settings.HEADER_IMG_BG,
+        "link": settings.HOST_SHARK_CF,
+        "department": department_name,
+        "name": email,
+        "tanggal": queued_at.strftime("%d/%m/%Y"),
+        "pukul": queued_at.strftime("%H:%M:%S"),
+        "label": label,
+        "isCorporate": label == settings.ARONAWA_LABEL
+    }
+
     template = 'email_invitation_department.html'
 
-    return send(mail, content, template)
+    return mail, content, template
 
 
 def role_approver_department(request, acc_id):
@@ -996,9 +1650,19 @@ def role_approver_department(request, acc_id):
 
         else:
             error = False
+            approval_links = {}
+
+            # every referenced department & account contact, prefetched once
+            department_ids = [int(data_approver['id']) for data_approver in data['department']]
+            departments = {department.id: department for department in
+                           Department.objects.filter(pk__in=department_ids, account_id=acc_id)}
+            contact_ids = [con_id for data_approver in data['department'] for cont in data_approver['approver']
+                           if len(cont) != 0 for con_id in cont['contactId']]
+            account_contact_ids = set(AccountContact.objects.filter(contact_id__in=contact_ids, account_id=acc_id)
+                                      .values_list('contact_id', flat=True))
 
             for data_approver in data['department']:
-                department_id = data_approver['id']
+                department_id = int(data_approver['id'])
                 for cont in data_approver['approver']:
                     if len(cont) != 0:
                         list_contact_id = cont['contactId']
@@ -1008,23 +1672,18 @@ def role_approver_department(request, acc_id):
                             break
 
                         order = cont['order']
-                        department = Department.objects.get(pk=department_id, account_id=acc_id)
+                        if department_id not in departments:
+                            raise Department.DoesNotExist()
+                        department = departments[department_id]
                         if (department.approval_number < order) or (order < 1):
                             res = response(400, message='{0}, order must be greater than 0 and less equal to max value approval number in department'.format(department.name))
                             error = True
                             break
 
                         for con_id in list_contact_id:
-                            AccountContact.objects.get(contact_id=con_id, account_id= acc_id)
-                            clean_data_bulk_app = structure_json_approval(department_id, con_id, order)
-                            serializer = ContactDeptApprovalSerializer(data=clean_data_bulk_app)
-
-                            if not serializer.is_valid():
-                                res = response(400, message=serializer.errors)
-                                error = True
-                                break
-
-                            serializer.update_or_create()
+                            if con_id not in account_contact_ids:
+                                raise AccountContact.DoesNotExist()
+                            approval_links[(department_id, con_id)] = order
 
                         item_res = {
                             "departmentName": department.name,
@@ -1033,6 +1692,7 @@ def role_approver_department(request, acc_id):
                         res_data.append(item_res)
 
             if not error:
+                save_approval_links(approval_links)
                 res = response(201, data = res_data, message="approval created", status=True)
 
     except Department.DoesNotExist:
@@ -1057,17 +1717,18 @@ def role_approver_department(request, acc_id):
 @csrf_exempt
 def remove_account(request, id, acc_id):
     try:
-        account_id_token = get_token_data(request._request.META, 'accountId')
-        super_admin = get_token_data(request._request.META, 'isSuperAdmin')
+        auth_context = get_auth_context(request)
+        account_id_token = auth_context.get('accountId')
+        super_admin = auth_context.get('isSuperAdmin')
         acc = AccountContact.objects.get(contact_id=acc_id, account__department__id=id)
         # check authorized parent account
-        is_cms = True if get_token_data(request.META, 'iss') != settings.JWT_ISSUER else False
+        is_cms = True if auth_context.get('iss') != settings.JWT_ISSUER else False
         check_access = check_access_account(account_id_token=account_id_token,
                                             super_admin=super_admin,
                                             account_id=acc.account_id,
                                             is_cms=is_cms)
 
-        if check_access is False or get_token_data(request._request.META, 'isAdmin') is False:
+        if check_access is False or auth_context.get('isAdmin') is False:
             return response(400, message='Unauthorized')
 
         department_requestor = ContactDepartmentRequestor.objects.filter(contact_id=acc_id, department_id=id)
@@ -1088,8 +1749,8 @@ def remove_account(request, id, acc_id):
             # remove contact & department in table contact_department_requestor
             department_requestor.delete()
             # insert log activity
-            insert_log_activity(log_from='department-requestor', old=old_department_requestor, new='', type='delete',
-                                request=request)
+            log_activity(log_from='department-requestor', old=old_department_requestor, new='', type='delete',
+                         request=request)
 
         if len(department_approval) > 0:
             # check transaction ongoing cannot delete user dept, only (done/canceled)
@@ -1106,9 +1767,10 @@ def remove_account(request, id, acc_id):
             old_department_approval = ContactDeptApprovalSerializer(department_approval.get()).data
             # remove contact & department in table contact_department_approval
             department_approval.delete()
+            reset_approval_chain(id)
             # insert log activity
-            insert_log_activity(log_from='department-approval', old=old_department_approval, new='', type='delete',
-                                request=request)
+            log_activity(log_from='department-approval', old=old_department_approval, new='', type='delete',
+                         request=request)
 
         # remove department in table accountContact
         acc.department_id = None
@@ -1122,6 +1784,156 @@ def remove_account(request, id, acc_id):
         return response(400, message='Bad Request')
 
 
+@method_decorator(csrf_exempt, name='dispatch')
+class DepartmentContactBulkView(APIView):
+    @partial(loginRequired, module="ACCOUNT", access="MANAGE")
+    def post(self, request):
+        return bulk_move_contact(request)
+
+
+def bulk_move_contact(request):
+    # payload: {"contacts": [{"contactId", "fromDepartmentId", "toDepartmentId" (empty to remove)}]}
+    data = JSONParser().parse(request)
+    items = setDefaultValue('contacts', data, [])
+    if not items:
+        return response(400, message="Field contacts should contain at least one contact")
+
+    auth_context = get_auth_context(request)
+    is_cms = True if auth_context.get('iss') != settings.JWT_ISSUER else False
+    if auth_context.get('isAdmin') is False:
+        return response(400, message='Unauthorized')
+
+    try:
+        moves = [(int(item['contactId']), int(item['fromDepartmentId']), int(item['toDepartmentId'])
+                  if item.get('toDepartmentId') else None) for item in items]
+    except (KeyError, TypeError, ValueError):
+        return response(400, message="Field contactId and fromDepartmentId is required")
+    contact_ids = {contact_id for contact_id, _, _ in moves}
+    # a contact listed twice would be moved by both entries, none of them is applied
+    duplicate_ids = {contact_id for contact_id, count in Counter(contact_id for contact_id, _, _ in moves).items()
+                     if count > 1}
+    nonstrict()
+    department_accounts = dict(Department.objects.filter(
+        id__in={from_id for _, from_id, _ in moves} | {to_id for _, _, to_id in moves if to_id}
+    ).values_list('id', 'account_id'))
+
+    for account_id in set(department_accounts.values()):
+        check_access = check_access_account(account_id_token=auth_context.get('accountId'),
+                                            super_admin=auth_context.get('isSuperAdmin'),
+                                            account_id=account_id, is_cms=is_cms)
+        if check_access is False:
+            return response(400, message='Unauthorized')
+
+    account_contacts = {(acc.contact_id, acc.account_id): acc for acc in AccountContact.objects.filter(
+        contact_id__in=contact_ids, account_id__in=set(department_accounts.values()))}
+    requestors = defaultdict(list)
+    for link in ContactDepartmentRequestor.objects.filter(contact_id__in=contact_ids,
+                                                          department_id__in={from_id for _, from_id, _ in moves}):
+        requestors[(link.contact_id, link.department_id)].append(link)
+    approvals = defaultdict(list)
+    for link in ContactDepartmentApproval.objects.filter(contact_id__in=contact_ids,
+                                                         department_id__in={from_id for _, from_id, _ in moves}):
+        approvals[(link.contact_id, link.department_id)].append(link)
+    requestor_blocked, approver_blocked = open_transaction_blockers(
+        [(contact_id, from_id, department_accounts.get(from_id)) for contact_id, from_id, _ in moves])
+
+    result = []
+    removed_requestors = []
+    removed_approvals = []
+    moved_contacts = defaultdict(list)
+    for contact_id, from_id, to_id in moves:
+        account_id = department_accounts.get(from_id)
+        acc = account_contacts.get((contact_id, account_id))
+        key = (contact_id, from_id)
+        status, message = True, "Contact successfully moved" if to_id else \
+            "Contact successfully deleted from department"
+
+        if contact_id in duplicate_ids:
+            status, message = False, "Duplicate contactId : {}".format(contact_id)
+        elif acc is None:
+            status, message = False, "Contact not found"
+        elif to_id and department_accounts.get(to_id) != account_id:
+            status, message = False, "Department not found"
+        elif key not in requestors and key not in approvals and acc.department_id != from_id:
+            status, message = False, "Contact is not listed in department"
+        elif (key in requestors and key in requestor_blocked) or (key in approvals and key in approver_blocked):
+            status, message = False, "The contact is currently ongoing transaction"
+        else:
+            removed_requestors.extend(requestors.get(key, []))
+            removed_approvals.extend(approvals.get(key, []))
+            moved_contacts[to_id].append(acc)
+
+        result.append({
+            "contactId": contact_id,
+            "fromDepartmentId": from_id,
+            "toDepartmentId": to_id,
+            "status": status,
+            "message": message
+        })
+
+    sid = transaction.savepoint()
+    try:
+        ContactDepartmentRequestor.objects.filter(id__in=[link.id for link in removed_requestors]).delete()
+        ContactDepartmentApproval.objects.filter(id__in=[link.id for link in removed_approvals]).delete()
+        for to_id, accs in moved_contacts.items():
+            AccountContact.objects.filter(id__in=[acc.id for acc in accs]).update(department_id=to_id)
+        reset_approval_chain(*{link.department_id for link in removed_approvals})
+        # queryset update skips the AccountContact signals
+        for acc in {acc for accs in moved_contacts.values() for acc in accs}:
+            reset_idor_cache(acc.contact_id)
+        for account_id in {acc.account_id for accs in moved_contacts.values() for acc in accs}:
+            contact_search_index.reset_account(account_id)
+
+        for link in removed_requestors:
+            log_activity(log_from='department-requestor', old=ContactDeptRequestorSerializer(link).data, new='',
+                         type='delete', request=request)
+        for link in removed_approvals:
+            log_activity(log_from='department-approval', old=ContactDeptApprovalSerializer(link).data, new='',
+                         type='delete', request=request)
+        transaction.savepoint_commit(sid)
+    except Exception as e:
+        transaction.savepoint_rollback(sid)
+        log.error(e)
+        return response(400, message='Bad Request')
+
+    status = any(item['status'] for item in result)
+    return response(200 if status else 400, data=result, message="Move contact department", status=status)
+
+
+def open_transaction_blockers(contact_departments):
+    # (contact, department) pairs blocked by an ongoing transaction, as requestor and as approver,
+    # for a list of (contact id, department id, account id)
+    contact_ids = {contact_id for contact_id, _, _ in contact_departments}
+    department_ids = {department_id for _, department_id, _ in contact_departments}
+    open_opportunity = Opportunity.objects.origin_query().filter(department_id__in=department_ids).exclude(
+        Q(stage_id="CLOSED_WIN") | Q(stage_id="CANCELED_BY_REQUESTOR") | Q(is_delete=True))
+
+    requestor_open = set(open_opportunity.filter(contact_id__in=contact_ids).order_by()
+                         .values_list('contact_id', 'department_id', 'account_id').distinct())
+    requestor_blocked = {(contact_id, department_id) for contact_id, department_id, account_id in contact_departments
+                         if (contact_id, department_id, account_id) in requestor_open}
+
+    # approver: any quotation the contact approves whose opportunity is still open in the department
+    user_quotations = TransactionApproval.objects.filter(user_id__in=contact_ids).values_list('user_id', 'quotation_id')
+    quotation_ids = defaultdict(set)
+    for user_id, quotation_id in user_quotations:
+        quotation_ids[quotation_id].add(user_id)
+    quotation_opportunity = dict(Quotation.objects.origin_query().filter(id__in=list(quotation_ids))
+                                 .values_list('id', 'opportunity_id'))
+    opportunities = {opportunity_id: (department_id, account_id) for opportunity_id, department_id, account_id in
+                     open_opportunity.filter(id__in=set(quotation_opportunity.values()))
+                     .values_list('id', 'department_id', 'account_id')}
+    approver_open = set()
+    for quotation_id, opportunity_id in quotation_opportunity.items():
+        if opportunity_id in opportunities:
+            for user_id in quotation_ids[quotation_id]:
+                approver_open.add((user_id,) + opportunities[opportunity_id])
+    approver_blocked = {(contact_id, department_id) for contact_id, department_id, account_id in contact_departments
+                        if (contact_id, department_id, account_id) in approver_open}
+
+    return requestor_blocked, approver_blocked
+
+
 @csrf_exempt
 def contact_invitation(request, id):
     data = JSONParser().parse(request)
@@ -1129,8 +1941,8 @@ def contact_invitation(request, id):
     data_res = []
     status_code = 201
 
-    department_exist = Department.objects.filter(id=id).count()
-    if department_exist == 0:
+    department_names = dict(Department.objects.filter(id=id).values_list('id', 'name'))
+    if len(department_names) == 0:
         return response(400, message="Department doesn't exist")
 
     account_id = setDefaultValue("accountId", data, '')
@@ -1150,105 +1962,140 @@ def contact_invitation(request, id):
 
     member_type = account_exist.first().member_type
 
-    for email in email_list:
-        # start transaction
-        sid = transaction.savepoint()
+    # resolve every email of the request at once: contacts, their account contacts & department names
+    valid_emails = {email: validate_email(email) for email in email_list}
+    contact_ids = defaultdict(list)
+    for email, contact_id in Contact.objects.filter(email__in=[email for email, valid in valid_emails.items() if valid],
+                                                    is_disabled=False).values_list('email', 'id'):
+        contact_ids[email].append(contact_id)
+    account_contacts = defaultdict(list)
+    for acc in AccountContact.objects.filter(contact_id__in=[contact_id for ids in contact_ids.values()
+                                                             for contact_id in ids], is_disabled=False):
+        account_contacts[acc.contact_id].append(acc)
+    department_names.update(Department.objects.filter(
+        id__in={acc.department_id for accs in account_contacts.values() for acc in accs if acc.department_id}
+    ).values_list('id', 'name'))
 
-        format_email = validate_email(email)
-        if format_email is False:
+    sid = transaction.savepoint()
+    moved_contacts = []
+    invitations = []
+    created_by = None
+
+    for email in answer_once(email_list, data_res):
+        if valid_emails[email] is False:
             message = "Format email is wrong"
             status = False
             data_res.append(invitationView.response_json(email, status, message))
-        else:
-            contact = Contact.objects.filter(email=email, is_disabled=False)
+            continue
 
-            if len(contact) > 0:
-                contact_ids = list(contact.values_list("id", flat=True))
-                acc_contact = AccountContact.objects.filter(account=account_id, contact_id__in=contact_ids, department=id, is_disabled=False)
+        if contact_ids[email]:
+            contact_accounts = [acc for contact_id in contact_ids[email] for acc in account_contacts[contact_id]]
+            if any(str(acc.account_id) == str(account_id) and str(acc.department_id) == str(id)
+                   for acc in contact_accounts):
+                message = "Already in choosen department"
+                status = False
+                data_res.append(invitationView.response_json(email, status, message))
+                continue
+
+            account_contact = [acc for acc in contact_accounts if str(acc.account_id) == str(account_id)] \
+                or contact_accounts
+            for acc in account_contact:
+                if acc.account_id == account_id and acc.department_id != id:
+                    email_data = {
+                        "lastDepartment": department_names.get(acc.department_id, '-'),
+                        "newDepartment": department_names[int(id)],
+                        "email": email,
+                        "memberType": member_type
+                    }
 
-                if len(acc_contact) > 0:
-                    message = "Already in choosen department"
-                    status = False
-                    data_res.append(invitationView.response_json(email, status, message))
+                    moved_contacts.append(acc)
+                    enqueue_mail('change-department', email_data)
+                    data_res.append(invitationView.responseJson(email, status, message=SUCCESS_INVITE_DEPT))
+                    break
+
+                elif acc.account_id != account_id:
+                    inv_data = structure_invitation({"account": acc.account_id, "contact": acc.contact_id,
+                                                     "department": acc.department_id}, email)
+                    serializer = invitationSerializers(data=invitationView.structure_json(inv_data))
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                    except Exception as e:
+                        data_res.append(invitationView.response_json(email, status=False, message=str(e)))
+                        save_contact_invitation(moved_contacts, invitations, id, request, member_type)
+                        transaction.savepoint_commit(sid)
+                        return response(400, data_res, " ", status=False)
+
+                    created_by = created_by or get_user_id(get_auth_context(request).get('email'))
+                    serializer.validated_data['created_by'] = created_by
+                    invitations.append(serializer)
+                    data_res.append(invitationView.responseJson(email, status, message=SUCCESS_INVITE_DEPT))
+                    break
+        else:
+            inv_data = {
+                "accountId": account_id,
+                "departmentId": id,
+                "email": email,
+            }
+            serializer = invitationSerializers(data=invitationView.structure_json(inv_data))
+            try:
+                serializer.is_valid(raise_exception=True)
+            except Exception as e:
+                data_res.append(invitationView.response_json(email, status=False, message=str(e)))
+                save_contact_invitation(moved_contacts, invitations, id, request, member_type)
+                transaction.savepoint_commit(sid)
+                return response(400, data_res, " ", status=False)
 
-                else:
-                    is_already_sent = False
-                    account_contact_exist = AccountContact.objects.filter(account=account_id, contact_id__in=contact_ids, is_disabled=False)
-                    account_contact = account_contact_exist if account_contact_exist > 0 \
-                        else AccountContact.objects.filter(contact_id__in=contact_ids, is_disabled=False)
-                    
-                    contact_list = AccContactSerializer(
-                        account_contact,
-                        many=True).data
-
-                    for item in contact_list:
-                        if is_already_sent == True:
-                            continue
-
-                        if item['account'] == account_id and item['department'] != id:
-                            current_department = '-'
-
-                            if item['department']:
-                                current_department = departmentSerializers(Department.objects.get(pk=item['department'])).data['name']
-
-                            email_data = {
-                                "lastDepartment": current_department,
-                                "newDepartment": departmentSerializers(Department.objects.get(pk=id)).data['name'],
-                                "email": email,
-                                "memberType": member_type
-                            }
-
-                            AccountContact.objects.filter(id=item['id'], is_disabled=False).update(department=id)
-                            send_email_change_department(email_data)
-                            data_res.append(invitationView.responseJson(email, status, message=SUCCESS_INVITE_DEPT))
-                            is_already_sent = True
-
-                        elif item['account'] != account_id:
-                            inv_data = structure_invitation(item, email)
-                            clean_data = invitationView.structure_json(inv_data)
-                            serializer = invitationSerializers(data=clean_data)
-
-                            try:
-                                if serializer.is_valid(raise_exception=True):
-                                    # todo token narwhal ngga ada userid done
-                                    serializer.validated_data['created_by'] = get_user_id(
-                                        get_token_data(request._request.META, 'email'))
-                                    serializer.save()
-
-                                    invitationView.sent_invitation(request, serializer.data, member_type=member_type)
-                                    data_res.append(invitationView.responseJson(email, status, message=SUCCESS_INVITE_DEPT))
-                                    is_already_sent = True
-
-                            except Exception as e:
-                                data_res.append(invitationView.response_json(email, status=False, message=str(e)))
-                                return response(400, data_res, " ", status=False)
-            else:
-                inv_data = {
-                    "accountId": account_id,
-                    "departmentId": id,
-                    "email": email,
-                }
-                clean_data = invitationView.structure_json(inv_data)
-                serializer = invitationSerializers(data=clean_data)
+            created_by = created_by or get_user_id(get_auth_context(request).get('email'))
+            serializer.validated_data['created_by'] = created_by
+            invitations.append(serializer)
+            data_res.append(invitationView.response_json(email, status, message=SUCCESS_INVITE_DEPT))
 
-                try:
-                    if serializer.is_valid(raise_exception=True):
-                        # todo token narwhal ngga ada userid done
-                        serializer.validated_data['created_by'] = get_user_id(
-                            get_token_data(request._request.META, 'email'))
-                        
-                        serializer.save()
-                        invitationView.sent_invitation(request, serializer.data, member_type=member_type)
-                        data_res.append(invitationView.response_json(email, status, message=SUCCESS_INVITE_DEPT))
-
-                except Exception as e:
-                    data_res.append(invitationView.response_json(email, status=False, message=str(e)))
-                    return response(400, data_res, " ", status=False)
+    try:
+        save_contact_invitation(moved_contacts, invitations, id, request, member_type)
+    except Exception as e:
+        transaction.savepoint_rollback(sid)
+        log.error(e)
+        return response(400, message='Bad Request')
 
     transaction.savepoint_commit(sid)
     return response(status_code, data_res, " ", status)
 
 
+def answer_once(emails, answers):
+    # every email once, in payload order; a repeated email is not handled again, it gets the answers of
+    # its first occurrence, so there is still one answer per email of the payload
+    answered = {}
+    for email in emails:
+        if email in answered:
+            answers.extend(answered[email])
+            continue
+        first = len(answers)
+        yield email
+        answered[email] = answers[first:]
+
+
+def save_contact_invitation(moved_contacts, invitations, department_id, request, member_type):
+    # write the department moves (one query) & invitations collected by contact_invitation
+    if moved_contacts:
+        AccountContact.objects.filter(id__in=[acc.id for acc in moved_contacts], is_disabled=False) \
+            .update(department=department_id)
+        # queryset update skips the AccountContact signals
+        for contact_id in {acc.contact_id for acc in moved_contacts}:
+            reset_idor_cache(contact_id)
+        for account_id in {acc.account_id for acc in moved_contacts}:
+            contact_search_index.reset_account(account_id)
+
+    if not invitations:
+        return
+
+    # one insert for all the invitations, see BulkListSerializer for when it falls back to one save per row
+    saved = BulkListSerializer(child=invitationSerializers()).create(
+        [serializer.validated_data for serializer in invitations])
+    context = request_context(request)
+    for invitation in saved:
+        enqueue_mail('invitation', context, dict(invitationSerializers(invitation).data), member_type=member_type)
+
+
 def contact_invite_department(request, acc_id):
     try:
         Account.objects.get(pk=acc_id)
@@ -1257,7 +2104,9 @@ def contact_invite_department(request, acc_id):
 
     try:
         data = JSONParser().parse(request)
-        validate_data = list(map(lambda item: validation_bulk_contact_invite(item, acc_id, request), data))
+        created_by = get_user_id(get_auth_context(request).get('email'))
+        context = request_context(request)
+        validate_data = list(map(lambda item: validation_bulk_contact_invite(item, acc_id, created_by, context), data))
         filter_validate_data = list(filter(lambda x: x['status'] == True, validate_data))
 
         if len(filter_validate_data) == 0:
@@ -1269,8 +2118,161 @@ def contact_invite_department(request, acc_id):
         return response(400, message=str(e))
 
 
-def send_email_change_department(data):
-    label, from_email, corporate_name, bisnis_label = get_label(data['memberType'])
+@method_decorator(csrf_exempt, name='dispatch')
+class ContactInviteDepartmentJobView(AccountJobView):
+    @partial(loginRequired, module="ACCOUNT", access="MANAGE")
+    def post(self, request, acc_id=''):
+        if not Account.objects.filter(pk=acc_id).exists():
+            return response(404, message="Account doesn't exists")
+
+        if not self.is_allowed(acc_id):
+            return response(400, message='Unauthorized')
+
+        data = JSONParser().parse(request)
+        if not isinstance(data, list) or len(data) == 0:
+            return response(400, message="Payload should contain at least one department")
+
+        # workers never see the request, everything they need from it is captured here
+        job = create_invite_job(acc_id, data, get_user_id(get_auth_context(request).get('email')),
+                                request_context(request))
+        for index in range(len(data)):
+            invite_queue.push({"jobId": job['id'], "index": index})
+
+        return response(202, data=invite_job_json(job, {}), message="Contact invite started", status=True)
+
+    @partial(loginRequired, module="ACCOUNT", access="MANAGE")
+    def get(self, request, acc_id='', job_id=''):
+        job = get_job('invite', job_id)
+        if not job or not self.is_allowed(job['accountId']):
+            return response(404, message="Invite job not found")
+
+        page = int(request.GET.get('page', 1))
+        limit = int(request.GET.get('limit', 20))
+        results = get_invite_job_results(job)
+        if invite_job_status(job, results) != JOB_STATUS_DONE:
+            # departments left behind by a stopped process are picked up by the process polling the job
+            invite_queue.wake()
+        # one entry per email, in payload order
+        paginator = Paginator([result for index in sorted(results) for result in results[index]['results']], limit)
+        meta = {
+            "page": page,
+            "limit": limit,
+            "totalPages": paginator.num_pages,
+            "totalRecords": paginator.count
+        }
+        data = invite_job_json(job, results)
+        data['results'] = paginator.page(page).object_list
+
+        return response(200, data=data, message="Get contact invite", status=True, meta=meta)
+
+
+def create_invite_job(acc_id, departments, created_by, context):
+    job = {
+        "id": uuid.uuid4().hex,
+        "accountId": acc_id,
+        "departments": departments,
+        "createdBy": created_by,
+        "requestContext": context
+    }
+    save_job('invite', job)
+
+    return job
+
+
+def invite_result_key(job_id, index):
+    return '{}:{}'.format(JOB_KEY.format('invite', job_id), index)
+
+
+def get_invite_job_results(job):
+    # {department index: {"done", "results": [email result, ...]}} for the departments started so far, each one
+    # in its own key so parallel workers never overwrite each other
+    keys = {index: invite_result_key(job['id'], index) for index in range(len(job['departments']))}
+    cached = cache.get_many(list(keys.values()))
+
+    return {index: cached[key] for index, key in keys.items() if key in cached}
+
+
+def invite_job_status(job, results):
+    processed = len([result for result in results.values() if result['done']])
+    if processed == len(job['departments']):
+        return JOB_STATUS_DONE
+
+    return JOB_STATUS_RUNNING if results else JOB_STATUS_PENDING
+
+
+def invite_job_json(job, results):
+    emails = [result for department in results.values() for result in department['results']]
+    return {
+        "id": job['id'],
+        "accountId": job['accountId'],
+        "status": invite_job_status(job, results),
+        "total": len(job['departments']),
+        "processed": len([result for result in results.values() if result['done']]),
+        "succeeded": len([result for result in emails if result['status']]),
+        "failed": len([result for result in emails if not result['status']])
+    }
+
+
+def run_invite_departments(messages):
+    errors = []
+    for message in messages:
+        try:
+            run_invite_department(message['jobId'], message['index'])
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+def run_invite_department(job_id, index):
+    job = get_job('invite', job_id)
+    if not job:
+        # expired, nothing left to report to
+        return
+
+    key = invite_result_key(job_id, index)
+    recorded = cache.get(key) or {"done": False, "results": []}
+    if recorded['done']:
+        return
+
+    item = job['departments'][index]
+    department_id = setDefaultValue('departmentId', item, None)
+    email_list = setDefaultValue('email', item, [])
+    if not isinstance(email_list, list) or not 1 <= len(email_list) <= 20:
+        # same department level checks as contact_invite_department
+        result = validation_bulk_contact_invite(item, job['accountId'], job['createdBy'], job['requestContext'])
+        recorded['results'] = [dict(result, departmentId=department_id, email=None)]
+    else:
+        # each email is recorded as soon as it is done: a department handled again after a worker crash
+        # only invites the emails that were not reached
+        for email in email_list[len(recorded['results']):]:
+            result = validation_bulk_contact_invite(dict(item, email=[email]), job['accountId'], job['createdBy'],
+                                                    job['requestContext'])
+            recorded['results'].append(dict(result, departmentId=department_id, email=email))
+            cache.set(key, recorded, JOB_TIMEOUT)
+
+    recorded['done'] = True
+    cache.set(key, recorded, JOB_TIMEOUT)
+
+
+def drop_invite_department(message, error):
+    # out of retries, the department is reported failed so the job still completes
+    key = invite_result_key(message['jobId'], message['index'])
+    recorded = cache.get(key) or {"results": []}
+    recorded['results'].append({"departmentId": None, "email": None, "status": False, "departmentName": None,
+                                "message": str(error)})
+    recorded['done'] = True
+    cache.set(key, recorded, JOB_TIMEOUT)
+
+
+# departments are queued in the shared cache, the ones a stopped process was handling are picked up by another one
+invite_queue = CacheQueue('department-invite-queue', run_invite_departments, invite_executor,
+                          lease=JOB_LEASE, timeout=JOB_TIMEOUT, on_drop=drop_invite_department)
+
+
+def change_department_mail(data, get_mail_label=get_label, queued_at=None):
+    queued_at = queued_at or datetime.now()
+    label, from_email, corporate_name, bisnis_label = get_mail_label(member_type=data['memberType'])
     mail = {
         "subject": "Anda Telah Diundang Untuk Bergabung Sebagai Pengguna {}".format(bisnis_label),
         "from_email": from_email,
@@ -1284,8 +2286,8 @@ def send_email_change_department(data):
         "lastDepartment": data['lastDepartment'],
         "newDepartment": data['newDepartment'],
         "name": data['email'],
-        "tanggal": datetime.now().strftime("%d/%m/%Y"),
-        "pukul": datetime.now().strftime("%H:%M:%S"),
+        "tanggal": queued_at.strftime("%d/%m/%Y"),
+        "pukul": queued_at.strftime("%H:%M:%S"),
         "label": label,
         "corporateName": corporate_name,
         "bisnisLabel": bisnis_label,
@@ -1294,7 +2296,18 @@ def send_email_change_department(data):
 
     template = 'email_change_department.html'
 
-    return send(mail, content, template)
+    return mail, content, template
+
+
+# mails rendered & sent by this module, through the batch connection
+MAIL_BUILDERS = {
+    'invitation-department': invitation_department_batch_mail,
+    'change-department': change_department_batch_mail,
+}
+# mails sent by other modules, one by one
+MAIL_SENDERS = {
+    'invitation': send_invitation,
+}
 
 
 def structure_invitation(item, email=''):
@@ -1324,133 +2337,391 @@ def structure_json(item):
     return data
 
 
+class ContactSummary:
+    """Compact contact record used by department contact lists."""
+
+    __slots__ = ('id', 'first_name', 'last_name', 'salutation', 'email')
+
+    def __init__(self, id, first_name, last_name, salutation, email):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.salutation = salutation
+        self.email = email
+
+    def to_json(self):
+        return {
+            "id": self.id,
+            "firstName": self.first_name,
+            "lastName": self.last_name,
+            "salutation": self.salutation,
+            "email": self.email
+        }
+
+
+class ContactLoader:
+    """Collects the contact ids a response needs and loads their summaries in one query."""
+
+    def __init__(self):
+        self.pending = set()
+        self.contacts = {}
+
+    def add(self, *contact_ids):
+        self.pending.update(*contact_ids)
+
+    def load(self, *filters):
+        # filtered (search) loads are not cached, the filter decides which contacts come back
+        contact_ids, self.pending = self.pending, set()
+        if not filters:
+            contact_ids -= set(self.contacts)
+        contacts = {} if filters else self.contacts
+        if contact_ids:
+            for contact in Contact.objects.filter(*filters, id__in=contact_ids).values_list(*ContactSummary.__slots__):
+                contacts[contact[0]] = ContactSummary(*contact)
+        return contacts
+
+
+class SearchIndex:
+    """In-process trigram index of a few text fields per row, one entry per account with LRU eviction.
+
+    Every account has a version in the shared cache, bumped by reset_account() in whichever process changes
+    its rows. A search first reads that version, an index built for an older one is rebuilt.
+    """
+
+    def __init__(self, name, max_accounts, timeout):
+        self.name = name
+        self.max_accounts = max_accounts
+        self.timeout = timeout
+        self.accounts = OrderedDict()
+        self.account_locks = {}
+        self.lock = threading.Lock()
+
+    def load(self, account_id):
+        # (id, field, ...) rows of an account
+        raise NotImplementedError
+
+    def rank(self, search, fields):
+        # exact (0), prefix (1) or substring (2) match of any field, None when nothing matches
+        if any(search == field for field in fields):
+            return 0
+        if any(field.startswith(search) for field in fields):
+            return 1
+        if any(search in field for field in fields):
+            return 2
+        return None
+
+    def search(self, account_id, search):
+        # sorted (rank, id) of the rows matching `search` like icontains on any field,
+        # None when the term is too short to have a trigram
+        search = search.lower()
+        if len(search) < 3:
+            return None
+
+        index = self.get_account(account_id)
+        with self.lock:
+            postings = [index['grams'].get(gram, set()) for gram in trigrams(search)]
+            ranked = []
+            for item_id in set.intersection(*postings):
+                rank = self.rank(search, index['items'][item_id])
+                if rank is not None:
+                    ranked.append((rank, item_id))
+
+        return sorted(ranked)
+
+    def version_key(self, account_id):
+        return '{}-version:{}'.format(self.name, account_id)
+
+    def get_account(self, account_id):
+        # read before the rows are loaded, so a change made while building leaves the index on an older version
+        version = cache_version(self.version_key(account_id))
+        # the shared lock only guards the dicts, an account is built under its own lock
+        # so a cold account doesn't hold up searches on the others
+        with self.lock:
+            index = self.get_fresh(account_id, version)
+            if index is not None:
+                return index
+            account_lock = self.account_locks.setdefault(account_id, threading.Lock())
+
+        with account_lock:
+            with self.lock:
+                index = self.get_fresh(account_id, version)
+                if index is not None:
+                    return index
+
+            index = self.build(account_id, version)
+
+            with self.lock:
+                self.accounts[account_id] = index
+                while len(self.accounts) > self.max_accounts:
+                    evicted, _ = self.accounts.popitem(last=False)
+                    self.account_locks.pop(evicted, None)
+        return index
+
+    def get_fresh(self, account_id, version):
+        index = self.accounts.get(account_id)
+        if index is None or index['version'] != version or index['built'] + self.timeout < time.monotonic():
+            return None
+
+        self.accounts.move_to_end(account_id)
+        return index
+
+    def build(self, account_id, version):
+        index = {"built": time.monotonic(), "version": version, "items": {}, "grams": defaultdict(set)}
+        for item_id, *fields in self.load(account_id):
+            self.add(index, item_id, fields)
+        return index
+
+    def add(self, index, item_id, fields):
+        fields = tuple((field or '').lower() for field in fields)
+        index['items'][item_id] = fields
+        for field in fields:
+            for gram in trigrams(field):
+                index['grams'][gram].add(item_id)
+
+    def reset_account(self, account_id):
+        with self.lock:
+            self.accounts.pop(account_id, None)
+        key = self.version_key(account_id)
+        bump_cache_version(key)
+        # bump again after commit, so an index built from the uncommitted rows is not kept
+        transaction.on_commit(lambda: bump_cache_version(key))
+
+
+class ContactSearchIndex(SearchIndex):
+    """First name, last name & email of the contacts of an account."""
+
+    def load(self, account_id):
+        return Contact.objects.filter(
+            id__in=AccountContact.objects.filter(account=account_id).values('contact_id')
+        ).values_list('id', 'first_name', 'last_name', 'email')
+
+    def reset_contact(self, contact_id):
+        # a contact is indexed in every account it belongs to
+        for account_id in AccountContact.objects.filter(contact_id=contact_id).values_list('account_id', flat=True) \
+                .distinct():
+            self.reset_account(account_id)
+
+
+class DepartmentSearchIndex(SearchIndex):
+    """Code & name of the departments, units & subunits of an account."""
+
+    def load(self, account_id):
+        nonstrict()
+        return Department.objects.filter(
+            account_id=account_id, type__in=[Department.TYPE_DEPARTMENT, Department.TYPE_UNIT, Department.TYPE_SUBUNIT]
+        ).values_list('id', 'code', 'name')
+
+    def rank(self, search, fields):
+        # only an exact code is an exact hit, like search_department_queryset ranks it in SQL
+        code, name = fields
+        if search == code:
+            return 0
+        if code.startswith(search) or name.startswith(search):
+            return 1
+        if search in code or search in name:
+            return 2
+        return None
+
+
+def trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def ranked_search_filter(ranked):
+    # (filter, rank) of sorted (rank, id) hits of a search index
+    whens = [When(id__in=[item_id for rank, item_id in ranked if rank == match], then=Value(match))
+             for match in (0, 1) if any(rank == match for rank, _ in ranked)]
+    return Q(id__in=[item_id for _, item_id in ranked]), Case(*whens, default=Value(2), output_field=IntegerField())
+
+
+def contact_search_filter(account_id, search):
+    # (filter, rank) of a search on first name, last name or email, rank orders exact (0), prefix (1)
+    # then substring (2) hits; answered from the contact search index when the term has a trigram
+    # & the hit list is small, short terms, no hit & large hit lists are matched by the database
+    if not search:
+        return Q(), Value(0, output_field=IntegerField())
+
+    ranked = contact_search_index.search(account_id, search)
+    if ranked and len(ranked) <= CONTACT_SEARCH_INDEX_MAX_HITS:
+        return ranked_search_filter(ranked)
+
+    return Q(first_name__icontains=search) | Q(last_name__icontains=search) | Q(email__icontains=search), Case(
+        When(Q(first_name__iexact=search) | Q(last_name__iexact=search) | Q(email__iexact=search), then=Value(0)),
+        When(Q(first_name__istartswith=search) | Q(last_name__istartswith=search) | Q(email__istartswith=search),
+             then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField()
+    )
+
+
+contact_search_index = ContactSearchIndex('department-contact-index',
+                                          getattr(settings, 'DEPARTMENT_CONTACT_INDEX_MAX_ACCOUNTS', 50),
+                                          getattr(settings, 'DEPARTMENT_CONTACT_INDEX_TIMEOUT', 300))
+department_search_index = DepartmentSearchIndex('department-search-index',
+                                                getattr(settings, 'DEPARTMENT_SEARCH_INDEX_MAX_ACCOUNTS', 50),
+                                                getattr(settings, 'DEPARTMENT_SEARCH_INDEX_TIMEOUT', 300))
+
+
+@receiver([post_save, post_delete], sender=Contact)
+def reset_contact_search_index(sender, instance, **kwargs):
+    contact_search_index.reset_contact(instance.id)
+
+
+@receiver([post_save, post_delete], sender=AccountContact)
+def reset_account_contact_search_index(sender, instance, **kwargs):
+    contact_search_index.reset_account(instance.account_id)
+
+
+@receiver([post_save, post_delete], sender=Department)
+def reset_department_search_index(sender, instance, **kwargs):
+    department_search_index.reset_account(instance.account_id)
+
+
 def restructure_json(item, id=None):
+    return restructure_json_list([item])[0]
+
+
+def restructure_json_list(items):
+    # build response for a page of departments with a fixed number of grouped queries
+    contact_loader = ContactLoader()
+    items = list(items)
+    ids = [setDefaultValue('id', item, '') for item in items]
+    dept_ids = [dept_id for dept_id in ids if dept_id]
+
+    # total unit & subunit per department
     nonstrict()
-    units = Department.objects.filter(parent_id=item['id'])
-    total_unit = units.count()
-    total_subunit = 0
-    for unit in units:
+    unit_parent = dict(Department.objects.filter(parent_id__in=dept_ids).values_list('id', 'parent_id'))
+    total_unit = Counter(unit_parent.values())
+    total_subunit = Counter()
+    if unit_parent:
         nonstrict()
-        total_subunit += Department.objects.filter(parent_id=unit.id).count()
-    id = setDefaultValue('id', item, '')
-    dept_id = id
-    parent_id = setDefaultValue('parent_id', item, id)
-    if parent_id:
-        # Check for unit
-        dept_data = Department.objects.filter(id=id).first()
-        if dept_data.type == 'UNIT':
-            dept_id = dept_data.parent.id
-        # Check for subunit
-        elif dept_data.type == 'SUBUNIT':
-            dept_id = dept_data.parent.parent.id
-    data = {
-        "id": id,
-        "accountId": setDefaultValue('account', item, ''),
-        "code": setDefaultValue('code', item, ''),
-        "name": setDefaultValue('name', item, ''),
-        "approvalNumber": setDefaultValue('approval_number', item, ''),
-        "priceLimit": setDefaultValue('price_limit', item, ''),
-        "shoppingLimit": setDefaultValue('shopping_limit', item, ''),
-        "budgetRemaining": getBudgetRemaining(setDefaultValue('id', item, None)),
-        "totalContact": setDefaultValue('total_contact', item, 0),
-        "totalUnit": total_unit,
-        "totalSubunit": total_subunit,
-        "lastUpdateBudget": get_last_budget_history(item['id']),
-        "departmentId": dept_id
-    }
-
-    if id:
-        list_contact_id = []
-
-        # approver contact list
-        approver_list = []
-        approver_number = setDefaultValue('approval_number', item, 0)
-        for order_number in range(approver_number):
-            order_number += 1
-            department_approver = ContactDepartmentApproval.objects.filter(department_id=id, order=order_number).distinct().order_by("order")
-            approver_id = []
-            if len(department_approver) > 0:
-                for approver in department_approver:
-                    list_contact_id.append(approver.contact_id)
-                    contact_detail = Contact.objects.get(id=approver.contact_id)
-                    approver_id.append({
-                        "id": contact_detail.id,
-                        "firstName": contact_detail.first_name,
-                        "lastName": contact_detail.last_name,
-                        "salutation": contact_detail.salutation,
-                        "email": contact_detail.email
-                    })
+        subunits = Department.objects.filter(parent_id__in=list(unit_parent)).order_by().values('parent_id') \
+            .annotate(total=Count('id'))
+        for subunit in subunits:
+            total_subunit[unit_parent[subunit['parent_id']]] += subunit['total']
 
-                approver_list.append({"contactId": approver_id, "order": order_number})
+    # root department of unit & subunit
+    nonstrict()
+    hierarchy = {
+        dept['id']: dept for dept in Department.objects.filter(id__in=dept_ids)
+        .values('id', 'type', 'parent_id', 'parent__parent_id')
+    }
 
-        # requestor contact list
-        account_contact_list = AccountContact.objects.filter(account=data['accountId'], is_disabled=False)
-        requestor_list = []
-        department_requestor = ContactDepartmentRequestor.objects.filter(department_id=id).distinct()
-        if len(department_requestor) > 0:
-            for requestor in department_requestor:
-                list_contact_id.append(requestor.contact_id)
-                contact_detail = Contact.objects.filter(id=requestor.contact_id).first()
-                if contact_detail:
-                    requestor_list.append({
-                        "id": contact_detail.id,
-                        "firstName": contact_detail.first_name,
-                        "lastName": contact_detail.last_name,
-                        "salutation": contact_detail.salutation,
-                        "email": contact_detail.email
-                    })
+    # approver, requestor & department contact per department
+    approvals = get_approval_chains(dept_ids)
+
+    requestors = defaultdict(list)
+    for requestor in ContactDepartmentRequestor.objects.filter(department_id__in=dept_ids).distinct():
+        requestors[requestor.department_id].append(requestor.contact_id)
+
+    account_ids = {setDefaultValue('account', item, '') for item in items}
+    department_contacts = defaultdict(list)
+    account_contact_dept = AccountContact.objects.filter(account__in=account_ids, department_id__in=dept_ids,
+                                                         is_disabled=False)
+    for account_contact in account_contact_dept.values('account_id', 'department_id', 'contact_id'):
+        department_contacts[(account_contact['account_id'], account_contact['department_id'])] \
+            .append(account_contact['contact_id'])
+
+    account_users = defaultdict(set)
+    account_contact_user = AccountContact.objects.filter(
+        account__in=account_ids, is_disabled=False, status__in=[Account.ACTIVATED, AccountContact.STATUS_REGISTERED])
+    for account_contact in account_contact_user.values('account_id', 'contact_id'):
+        account_users[account_contact['account_id']].add(account_contact['contact_id'])
+
+    if dept_ids:
+        contact_loader.add(*account_users.values(), *department_contacts.values(), *requestors.values())
+        for levels in approvals.values():
+            contact_loader.add(*levels.values())
+    contacts = contact_loader.load()
+
+    result = []
+    for item, id in zip(items, ids):
+        dept_id = id
+        parent_id = setDefaultValue('parent_id', item, id)
+        if parent_id:
+            dept_data = hierarchy.get(id)
+            # Check for unit
+            if dept_data['type'] == 'UNIT':
+                dept_id = dept_data['parent_id']
+            # Check for subunit
+            elif dept_data['type'] == 'SUBUNIT':
+                dept_id = dept_data['parent__parent_id']
+        data = {
+            "id": id,
+            "accountId": setDefaultValue('account', item, ''),
+            "code": setDefaultValue('code', item, ''),
+            "name": setDefaultValue('name', item, ''),
+            "approvalNumber": setDefaultValue('approval_number', item, ''),
+            "priceLimit": setDefaultValue('price_limit', item, ''),
+            "shoppingLimit": setDefaultValue('shopping_limit', item, ''),
+            "budgetRemaining": getBudgetRemaining(setDefaultValue('id', item, None)),
+            "totalContact": setDefaultValue('total_contact', item, 0),
+            "totalUnit": total_unit[id],
+            "totalSubunit": total_subunit[id],
+            "lastUpdateBudget": get_last_budget_history(item['id']),
+            "departmentId": dept_id
+        }
 
-        account_contact_exist = account_contact_list.filter(department_id=id).exclude(contact_id__in=list_contact_id)
-
-        if len(account_contact_exist) > 0:
-            for contact_exist in account_contact_exist:
-                list_contact_id.append(contact_exist.contact_id)
-                contact_detail = Contact.objects.filter(id=contact_exist.contact_id).first()
-                if contact_detail:
-                    requestor_list.append({
-                        "id": contact_detail.id,
-                        "firstName": contact_detail.first_name,
-                        "lastName": contact_detail.last_name,
-                        "salutation": contact_detail.salutation,
-                        "email": contact_detail.email
-                    })
+        if id:
+            list_contact_id = []
 
-        # user contact list
-        email_list = []
-        data['accountId'] = item['account_id'] if data['accountId'] == '' else data['accountId']
-        contact_ids = account_contact_list.filter(
-            status__in=[Account.ACTIVATED, AccountContact.STATUS_REGISTERED]).exclude(
-            contact_id__in=list_contact_id).values_list("contact_id", flat=True)
-        contact_detail_list = Contact.objects.filter(id__in=contact_ids)
-        for user_list in contact_detail_list:
-            email_list.append({
-                "id": user_list.id,
-                "firstName": user_list.first_name,
-                "lastName": user_list.last_name,
-                "salutation": user_list.salutation,
-                "email": user_list.email
+            # approver contact list
+            approver_list = []
+            approver_number = setDefaultValue('approval_number', item, 0)
+            for order_number in range(approver_number):
+                order_number += 1
+                department_approver = approvals[id].get(order_number, ())
+                approver_id = []
+                if len(department_approver) > 0:
+                    for contact_id in department_approver:
+                        list_contact_id.append(contact_id)
+                        if contact_id not in contacts:
+                            raise Contact.DoesNotExist("Contact matching query does not exist.")
+                        approver_id.append(contacts[contact_id].to_json())
+
+                    approver_list.append({"contactId": approver_id, "order": order_number})
+
+            # requestor contact list
+            requestor_list = []
+            for contact_id in requestors[id]:
+                list_contact_id.append(contact_id)
+                if contact_id in contacts:
+                    requestor_list.append(contacts[contact_id].to_json())
+
+            account_contact_exist = [contact_id for contact_id in department_contacts[(data['accountId'], id)]
+                                     if contact_id not in list_contact_id]
+            for contact_id in account_contact_exist:
+                list_contact_id.append(contact_id)
+                if contact_id in contacts:
+                    requestor_list.append(contacts[contact_id].to_json())
+
+            # user contact list
+            data['accountId'] = item['account_id'] if data['accountId'] == '' else data['accountId']
+            exclude_contact_id = set(list_contact_id)
+            users = account_users[setDefaultValue('account', item, '')]
+            email_list = [contact.to_json() for contact_id, contact in contacts.items()
+                          if contact_id in users and contact_id not in exclude_contact_id]
+
+            total_contact = len(approver_list) + len(requestor_list)
+            data.update({
+                "user": email_list,
+                "approver": approver_list,
+                "requestor": requestor_list,
+                "totalContact": total_contact
             })
 
-        total_contact = len(approver_list) + len(requestor_list)
-        data.update({
-            "user": email_list,
-            "approver": approver_list,
-            "requestor": requestor_list,
-            "totalContact": total_contact
-        })
+        result.append(data)
 
-    return data
+    return result
 
 def restructures_json(item, id=None):
     department_parent = ""
     unit_parent = ""
     if str(item['type']).lower() == "subunit":
         nonstrict()
-        unit = Department.objects.filter(id=item['parent_id']).first()
-        unit_parent = unit.name
-        nonstrict()
-        department = Department.objects.filter(id=unit.parent_id).first()
-        department_parent = department.name
+        unit = Department.objects.filter(id=item['parent_id']).values('name', 'parent__name').first()
+        unit_parent = unit['name']
+        department_parent = unit['parent__name']
     elif str(item['type']).lower() == "unit":
         nonstrict()
         department = Department.objects.filter(id=item['parent_id']).first()
@@ -1473,83 +2744,8 @@ def restructures_json(item, id=None):
     }
     return data
 
-def restructure_json_nonapprover(item, id, search):
-    list_contact_id = []
-    account_id = setDefaultValue('account', item, '')
-
-    # approver list of contact id
-    approver_number = setDefaultValue('approval_number', item, 0)
-    for order_number in range(approver_number):
-        order_number += 1
-        department_approver = ContactDepartmentApproval.objects.\
-            filter(department_id=id, order=order_number).\
-            order_by("order")
-        for approver in department_approver:
-            list_contact_id.append(approver.contact_id)
-
-    # requestor contact list
-    requestor_list = []
-    department_requestor = ContactDepartmentRequestor.objects.\
-        filter(department_id=id)
-    for requestor in department_requestor:
-        list_contact_id.append(requestor.contact_id)
-        contact_detail = Contact.objects.filter(
-            Q(id=requestor.contact_id),
-            Q(first_name__icontains=search) | Q(last_name__icontains=search) | Q(email__icontains=search)
-        ).first()
-        if contact_detail is None: continue
-        requestor_list.append({
-            "id": contact_detail.id,
-            "firstName": contact_detail.first_name,
-            "lastName": contact_detail.last_name,
-            "salutation": contact_detail.salutation,
-            "email": contact_detail.email
-        })
 
-    account_contact_exist = AccountContact.objects.\
-        filter(account=account_id, department_id=id, is_disabled=False).\
-        exclude(contact_id__in=list_contact_id)
-    for contact_exist in account_contact_exist:
-        list_contact_id.append(contact_exist.contact_id)
-        contact_detail = Contact.objects.filter(
-            Q(id=contact_exist.contact_id),
-            Q(first_name__icontains=search) | Q(last_name__icontains=search) | Q(email__icontains=search)
-        ).first()
-        if contact_detail is None: continue
-        requestor_list.append({
-            "id": contact_detail.id,
-            "firstName": contact_detail.first_name,
-            "lastName": contact_detail.last_name,
-            "salutation": contact_detail.salutation,
-            "email": contact_detail.email
-        })
-
-    # user contact list
-    email_list = []
-    account_contact = AccountContact.objects.filter(status__in=[Account.ACTIVATED, AccountContact.STATUS_REGISTERED],
-                                                    account=account_id, is_disabled=False).exclude(
-        contact_id__in=list_contact_id)
-    contact_list = account_contact.values_list("contact_id", flat=True)
-    contact_detail_list = Contact.objects.filter(
-        Q(id__in=contact_list),
-        Q(first_name__icontains=search) | Q(last_name__icontains=search) | Q(email__icontains=search)
-    )
-    for user_list in contact_detail_list:
-        email_list.append({
-            "id": user_list.id,
-            "firstName": user_list.first_name,
-            "lastName": user_list.last_name,
-            "salutation": user_list.salutation,
-            "email": user_list.email
-        })
-
-    # finalizing data result
-    result = (email_list + requestor_list)
-
-    return result
-
-
-def validation(data, pk=None):
+def validation(data, pk=None, existing_codes=None):
     res = {
         "code": 200,
         "message": "Success"
@@ -1558,7 +2754,9 @@ def validation(data, pk=None):
     try:
         # validation code
         if data['code']:
-            if pk:
+            if existing_codes is not None:
+                total_department = 1 if data['code'] in existing_codes else 0
+            elif pk:
                 total_department = Department.objects.filter(account=data['account'], code=data['code']).exclude(pk=pk).count()
             else:
                 total_department = Department.objects.filter(account=data['account'], code=data['code']).count()
@@ -1590,15 +2788,41 @@ def validation(data, pk=None):
         }
 
 
+class BulkListSerializer(serializers.ListSerializer):
+    """ListSerializer of a model serializer that saves every row with one bulk insert.
+
+    bulk_create() skips the child create(), the model save() and post_save. The bulk insert is only used while
+    the child keeps ModelSerializer.create() and its model keeps Model.save(), and no row sets a many-to-many
+    field; the rows are saved one by one through the child otherwise. post_save is sent for every inserted row,
+    so receivers outside this module still run. Validated keys are passed to the model as ModelSerializer.create()
+    does, a key that is not a field (budget) fails the same way.
+    """
+
+    def create(self, validated_data):
+        if type(self.child).create is not serializers.ModelSerializer.create:
+            return super().create(validated_data)
+
+        model = self.child.Meta.model
+        many_to_many = {field.name for field in model._meta.many_to_many}
+        if model.save is not models.Model.save or any(many_to_many.intersection(item) for item in validated_data):
+            return super().create(validated_data)
+
+        instances = model._default_manager.bulk_create([model(**item) for item in validated_data])
+        for instance in instances:
+            post_save.send(sender=model, instance=instance, created=True, update_fields=None, raw=False,
+                           using=instance._state.db)
+        return instances
+
+
 def bulk_create(request, acc_id):
     data = JSONParser().parse(request)
     list(map(lambda item: item.update({'accountId': acc_id}), data))
     # extract code
     ex_code = [d['code'] for d in data]
-    dup_code = {i: ex_code.count(i) for i in ex_code}
+    dup_code = Counter(ex_code)
 
     # get max duplicate
-    max_code = max({ex_code.count(i) for i in ex_code})
+    max_code = max(dup_code.values())
 
     if max_code > 1:
         list_duplicate = []
@@ -1625,7 +2849,11 @@ def bulk_create(request, acc_id):
         return response(400, message="Account not found")
 
     clean_data = list(map(lambda item: structure_json(item), data))
-    validate = list(map(lambda item: validation(item), clean_data))
+
+    # code uniqueness of every row against the account in one query
+    existing_codes = set(Department.objects.filter(account=acc_id, code__in=[item['code'] for item in clean_data])
+                         .values_list('code', flat=True))
+    validate = list(map(lambda item: validation(item, existing_codes=existing_codes), clean_data))
 
     check_validate = list(map(lambda item: result_validate(item), validate))
 
@@ -1634,33 +2862,29 @@ def bulk_create(request, acc_id):
     if len(ck) > 0:
         return response(400, message=check_validate)
 
-    serializer = departmentSerializers(data=clean_data, many=True)
+    serializer = BulkListSerializer(child=departmentSerializers(), data=clean_data)
 
     try:
         # start transaction
         sid = transaction.savepoint()
 
         if serializer.is_valid(raise_exception=True):
-            serializer.save()
+            departments = serializer.save()
+            department_data = serializer.data
 
             # save budget
             data_budget = list(filter(lambda x: x['budget'] > 0, data))
             if len(data_budget) > 0:
-                clean_datas_budget = list(map(lambda item: clean_budget(item, acc_id), data_budget))
-
-                res_budget = []
-                for cldb in clean_datas_budget:
-                    store_budget = save_budget(cldb)
-                    load_store_budget = json.loads(store_budget.content.decode())
-
-                    res_budget.append(load_store_budget['data'])
+                department_ids = {department.code: department.id for department in departments}
+                seed_budgets([(department_ids[item['code'].upper()], item['budget'], "Penambahan budget", "PLUS")
+                              for item in data_budget])
 
             message = "Success create department"
             status = True
 
             transaction.savepoint_commit(sid)
 
-            res = list(map(lambda item: restructure_json(item), serializer.data))
+            res = restructure_json_list(department_data)
 
             return response(201, res, message, status)
 
@@ -1680,21 +2904,316 @@ def result_validate(data):
     return res
 
 
-def clean_budget(item, acc_id):
+def seed_budgets(budgets):
+    # budgets: list of (department id, value, description, status), saved through the budget history one by one
+    for department_id, value, description, status in budgets:
+        store_budget = save_budget({
+            "departmentId": department_id,
+            "value": value,
+            "description": description,
+            "status": status
+        })
+        if store_budget.status_code >= 400:
+            raise ValueError(json.loads(store_budget.content.decode()).get('message'))
 
-    get_department = Department.objects.filter(account=acc_id, code=item['code'].upper()).get()
 
-    data = {
-        "departmentId": get_department.id,
-        "value": setDefaultValue('budget', item, ''),
-        "description": "Penambahan budget",
-        "status": "PLUS"
+@method_decorator(csrf_exempt, name='dispatch')
+class DepartmentImportView(AccountJobView):
+    @partial(loginRequired, module="ACCOUNT", access="MANAGE")
+    def post(self, request, acc_id='', job_id=''):
+        if job_id:
+            return self.resume(job_id)
+
+        if not self.is_allowed(acc_id):
+            return response(400, message='Unauthorized')
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return response(400, message="Field file is required")
+
+        file_format = IMPORT_FORMAT_NDJSON if upload.name.lower().endswith(('.ndjson', '.jsonl')) else IMPORT_FORMAT_CSV
+        job = create_import_job(acc_id, upload, file_format)
+        import_queue.push({"jobId": job['id']})
+
+        return response(202, data=import_job_json(job), message="Department import started", status=True)
+
+    @partial(loginRequired, module="ACCOUNT", access="MANAGE")
+    def get(self, request, acc_id='', job_id=''):
+        job = get_job('import', job_id)
+        if not job or not self.is_allowed(job['accountId']):
+            return response(404, message="Import job not found")
+
+        if job['status'] in (JOB_STATUS_PENDING, JOB_STATUS_RUNNING):
+            # an import left behind by a stopped process is picked up by the process polling the job
+            import_queue.wake()
+
+        page = int(request.GET.get('page', 1))
+        limit = int(request.GET.get('limit', 20))
+        paginator = Paginator(job['errors'], limit)
+        meta = {
+            "page": page,
+            "limit": limit,
+            "totalPages": paginator.num_pages,
+            "totalRecords": paginator.count
+        }
+        data = import_job_json(job)
+        data['errors'] = paginator.page(page).object_list
+
+        return response(200, data=data, message="Get department import", status=True, meta=meta)
+
+    def resume(self, job_id):
+        job = get_job('import', job_id)
+        if not job or not self.is_allowed(job['accountId']):
+            return response(404, message="Import job not found")
+
+        if job['status'] != JOB_STATUS_FAILED:
+            return response(400, message="Only failed import can be resumed")
+
+        job['status'] = JOB_STATUS_PENDING
+        save_job('import', job)
+        import_queue.push({"jobId": job['id']})
+
+        return response(202, data=import_job_json(job), message="Department import resumed", status=True)
+
+
+def create_import_job(acc_id, upload, file_format):
+    remove_expired_imports()
+    job_id = uuid.uuid4().hex
+    path = os.path.join(IMPORT_DIR, IMPORT_FILE_PREFIX + job_id)
+    # the upload is deleted at the end of the request, keep a copy for the worker & resume
+    with open(path, 'wb') as destination:
+        for chunk in upload.chunks():
+            destination.write(chunk)
+
+    job = {
+        "id": job_id,
+        "accountId": acc_id,
+        "format": file_format,
+        "path": path,
+        "status": JOB_STATUS_PENDING,
+        "processed": 0,
+        "inserted": 0,
+        "failed": 0,
+        "errors": [],
+        "message": ""
+    }
+    save_job('import', job)
+
+    return job
+
+
+def remove_expired_imports():
+    # the upload of a failed import is kept for its resume, it is removed once the job itself has expired
+    for entry in os.scandir(IMPORT_DIR):
+        if not entry.name.startswith(IMPORT_FILE_PREFIX):
+            continue
+        try:
+            # files younger than a lease may belong to a job being created
+            if time.time() - entry.stat().st_mtime > JOB_LEASE and \
+                    get_job('import', entry.name[len(IMPORT_FILE_PREFIX):]) is None:
+                os.remove(entry.path)
+        except OSError:
+            # removed meanwhile by another process
+            pass
+
+
+def import_job_json(job):
+    return {
+        "id": job['id'],
+        "accountId": job['accountId'],
+        "status": job['status'],
+        "processed": job['processed'],
+        "inserted": job['inserted'],
+        "failed": job['failed'],
+        "message": job['message']
     }
 
+
+def run_department_imports(messages):
+    for message in messages:
+        # the claim is renewed after every chunk, it only expires when the worker running the import is gone
+        run_department_import(message['jobId'], lambda: import_queue.extend(message))
+    return [None] * len(messages)
+
+
+def run_department_import(job_id, renew=lambda: None):
+    job = get_job('import', job_id)
+    if not job or job['status'] in (JOB_STATUS_DONE, JOB_STATUS_FAILED):
+        return
+
+    job['status'] = JOB_STATUS_RUNNING
+    save_job('import', job)
+    try:
+        recover_import_chunk(job)
+        chunk = []
+        # committed rows are skipped, so an interrupted or failed job resumes from the first uncommitted chunk
+        for row in read_import_rows(job['path'], job['format'], job['processed']):
+            chunk.append(row)
+            if len(chunk) == IMPORT_CHUNK_SIZE:
+                import_department_chunk(job, chunk)
+                renew()
+                chunk = []
+        if chunk:
+            import_department_chunk(job, chunk)
+
+        job['status'] = JOB_STATUS_DONE
+        save_job('import', job)
+        os.remove(job['path'])
+    except Exception as e:
+        log.error(e)
+        job['status'] = JOB_STATUS_FAILED
+        job['message'] = str(e)
+        save_job('import', job)
+    finally:
+        connection.close()
+
+
+# imports are queued in the shared cache, an import a stopped process was running is picked up by another one
+import_queue = CacheQueue('department-import-queue', run_department_imports, import_executor, lease=JOB_LEASE,
+                          timeout=JOB_TIMEOUT)
+
+
+def read_import_rows(path, file_format, offset=0):
+    # rows are read lazily so memory stays flat whatever the file size
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        if file_format == IMPORT_FORMAT_NDJSON:
+            # parsed per row, so a malformed line is reported as a row error
+            rows = (line for line in file if line.strip())
+        else:
+            rows = csv.DictReader(file)
+
+        for number, row in enumerate(rows, start=1):
+            if number > offset:
+                yield number, row
+
+
+def import_department_chunk(job, rows):
+    acc_id = job['accountId']
+    errors = []
+    clean_rows = []
+    for number, item in rows:
+        try:
+            item = json.loads(item) if isinstance(item, str) else item
+            clean_rows.append((number, item, structure_import_row(item, acc_id)))
+        except Exception as e:
+            code = item.get('code', '') if isinstance(item, dict) else ''
+            errors.append({"row": number, "code": code, "message": str(e)})
+
+    dup_code = Counter([clean['code'] for _, _, clean in clean_rows])
+    existing_codes = set(Department.objects.filter(account=acc_id, code__in=list(dup_code))
+                         .values_list('code', flat=True))
+
+    field_names = {field.name for field in Department._meta.concrete_fields}
+    inserted_codes = []
+    with transaction.atomic():
+        # parents first, so unit & subunit of the same chunk can refer to them
+        for dept_type, parent_type in ((Department.TYPE_DEPARTMENT, None),
+                                       (Department.TYPE_UNIT, Department.TYPE_DEPARTMENT),
+                                       (Department.TYPE_SUBUNIT, Department.TYPE_UNIT)):
+            level_rows = [row for row in clean_rows if row[2]['type'] == dept_type]
+            if not level_rows:
+                continue
+
+            parents = {}
+            if parent_type:
+                parent_codes = [clean['parent_code'] for _, _, clean in level_rows]
+                parents = {code: (id, type) for code, id, type in Department.objects.filter(
+                    account=acc_id, code__in=parent_codes).values_list('code', 'id', 'type')}
+
+            departments = []
+            budgets = []
+            for number, item, clean in level_rows:
+                validate = validation(clean, existing_codes=existing_codes)
+                message = validate['message']
+                if validate['code'] == 200 and dup_code[clean['code']] > 1:
+                    message = "Duplicate code : " + clean['code']
+                elif validate['code'] == 200 and parent_type and \
+                        parents.get(clean['parent_code'], (None, None))[1] != parent_type:
+                    message = "Parent code not found : " + clean['parent_code']
+                elif validate['code'] == 200:
+                    message = None
+
+                if message:
+                    errors.append({"row": number, "code": clean['code'], "message": message})
+                    continue
+
+                # same field checks as bulk_create (required name, lengths, numeric limits)
+                serializer = departmentSerializers(data=clean)
+                if not serializer.is_valid():
+                    errors.append({"row": number, "code": clean['code'], "message": "Invalid data",
+                                   "errors": json.loads(json.dumps(serializer.errors))})
+                    continue
+
+                values = {key: value for key, value in serializer.validated_data.items() if key in field_names}
+                values.pop('parent', None)
+                values.update(type=dept_type, parent_id=parents[clean['parent_code']][0] if parent_type else None)
+                departments.append(Department(**values))
+                if item.get('budget', 0) > 0:
+                    budgets.append(item)
+
+            departments = Department.objects.bulk_create(departments)
+            inserted_codes += [department.code for department in departments]
+
+            department_ids = {department.code: department.id for department in departments}
+            seed_budgets([(department_ids[item['code'].upper()], item['budget'], "Penambahan budget", "PLUS")
+                          for item in budgets])
+
+        # recorded before the commit: when the worker stops between the commit & the save_job below,
+        # recover_import_chunk finds these codes in the database and counts the chunk as done
+        job['pending'] = {"processed": rows[-1][0], "codes": inserted_codes, "errors": errors}
+        save_job('import', job)
+
+    # bulk insert skips the Department signals
+    reset_idor_cache()
+    department_search_index.reset_account(acc_id)
+    finish_import_chunk(job)
+
+
+def recover_import_chunk(job):
+    # the last chunk of an interrupted run committed or not, all its rows together
+    pending = job.get('pending')
+    if not pending:
+        return
+
+    if pending['codes'] and Department.objects.filter(account=job['accountId'], code__in=pending['codes']) \
+            .count() == len(pending['codes']):
+        finish_import_chunk(job)
+    else:
+        # rolled back (or nothing inserted), the rows are imported again
+        del job['pending']
+        save_job('import', job)
+
+
+def finish_import_chunk(job):
+    pending = job.pop('pending')
+    job['processed'] = pending['processed']
+    job['inserted'] += len(pending['codes'])
+    job['failed'] += len(pending['errors'])
+    job['errors'] = (job['errors'] + sorted(pending['errors'], key=lambda error: error['row']))[:IMPORT_MAX_ERRORS]
+    save_job('import', job)
+
+
+def structure_import_row(item, acc_id):
+    item['accountId'] = acc_id
+    for key in ('approvalNumber', 'priceLimit', 'shoppingLimit', 'budget'):
+        value = item.get(key)
+        if value is not None and str(value).strip():
+            item[key] = int(value)
+        elif key == 'budget':
+            item.pop(key, None)
+        else:
+            item[key] = 0
+
+    data = structure_json(item)
+    data['type'] = str(setDefaultValue('type', item, '') or Department.TYPE_DEPARTMENT).upper()
+    data['parent_code'] = str(setDefaultValue('parentCode', item, '')).upper()
+    if data['type'] not in (Department.TYPE_DEPARTMENT, Department.TYPE_UNIT, Department.TYPE_SUBUNIT):
+        raise ValueError("Invalid type : " + data['type'])
+
     return data
 
 
-def validation_bulk_contact_invite(data, acc_id, request):
+def validation_bulk_contact_invite(data, acc_id, created_by, context):
     # check department exist
     res = {
         "status": False,
@@ -1779,7 +3298,7 @@ def validation_bulk_contact_invite(data, acc_id, request):
 
                                             AccountContact.objects.filter(id=item['id'], is_disabled=False).update(
                                                 department=department.id)
-                                            send_email_change_department(email_data)
+                                            enqueue_mail('change-department', email_data)
                                             status = True
                                             department_name = department.name
                                             message = SUCCESS_INVITE_DEPT
@@ -1794,11 +3313,10 @@ def validation_bulk_contact_invite(data, acc_id, request):
                                             try:
                                                 if serializer.is_valid(raise_exception=True):
 
-                                                    serializer.validated_data['created_by'] = get_user_id(
-                                                        get_token_data(request._request.META, 'email'))
+                                                    serializer.validated_data['created_by'] = created_by
                                                     serializer.save()
 
-                                                    invitationView.sent_invitation(request, serializer.data, member_type=member_type)
+                                                    enqueue_mail('invitation', context, dict(serializer.data), member_type=member_type)
                                                     status = True
                                                     department_name = department.name
                                                     message = SUCCESS_INVITE_DEPT
@@ -1828,10 +3346,9 @@ def validation_bulk_contact_invite(data, acc_id, request):
                                 try:
                                     if serializer.is_valid(raise_exception=True):
 
-                                        serializer.validated_data['created_by'] = get_user_id(
-                                            get_token_data(request._request.META, 'email'))
+                                        serializer.validated_data['created_by'] = created_by
                                         serializer.save()
-                                        invitationView.sent_invitation(request, serializer.data, member_type=member_type)
+                                        enqueue_mail('invitation', context, dict(serializer.data), member_type=member_type)
 
                                         status = True
                                         department_name = department.name
@@ -1883,12 +3400,29 @@ def structure_json_requestor(department_id, contact_id):
 
     return data
 
+
+class DepartmentHierarchy:
+    """Root department of departments, units and subunits, read with their parent & grandparent in one query."""
+
+    def __init__(self, departments):
+        self.roots = {}
+        for dept in departments.values(*[prefix + field for prefix in ('', 'parent__', 'parent__parent__')
+                                         for field in ('id', 'type', 'name')]):
+            # subunit -> unit -> department, the topmost ancestor when the chain has no department
+            chain = [{"id": dept[prefix + 'id'], "type": dept[prefix + 'type'], "name": dept[prefix + 'name']}
+                     for prefix in ('', 'parent__', 'parent__parent__') if dept[prefix + 'id']]
+            self.roots[dept['id']] = next((node for node in chain if node['type'] == Department.TYPE_DEPARTMENT),
+                                          chain[-1])
+
+    def root(self, dept_id):
+        return self.roots.get(dept_id)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class DeptListAccountView(APIView):
     @partial(loginRequired, module="ACCOUNT", access="MANAGE")
     def get(self, request):
         query_param = request.GET
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
 
         if query_param.get('account_id', ''):
             status, message = self.check_for_IDOR(token, query_param.get('account_id', ''))
@@ -1993,7 +3527,7 @@ class DeptListAccountView(APIView):
 
         if token_ids:
             query &= Q(id__in=token_ids)
-        for unit_data in Department.objects.origin_query().filter(query):
+        for unit_data in Department.objects.origin_query().filter(query).select_related('parent'):
             if unit_data.type == Department.TYPE_SUBUNIT:
                 if unit_data.parent.id not in unit_id_list:
                     unit_list.append({
@@ -2012,37 +3546,26 @@ class DeptListAccountView(APIView):
 
     def get_department_data(self, account_id, department_ids=[]):
         dept_list = {}
-        query = Q(account_id=account_id)
+        departments = Department.objects.origin_query().filter(
+            account_id=account_id, type__in=[Department.TYPE_DEPARTMENT, Department.TYPE_UNIT, Department.TYPE_SUBUNIT])
         if department_ids:
-            query &= Q(id__in=department_ids)
-
-        for dept_data in Department.objects.origin_query().filter(query):
-            if dept_data.type == Department.TYPE_DEPARTMENT:
-                if dept_data.id in dept_list: continue
-                dept_list[dept_data.id] = {
-                    "deptId": dept_data.id,
-                    "deptName": dept_data.name
-                }
-            elif dept_data.type == Department.TYPE_UNIT:
-                if dept_data.parent.id in dept_list: continue
-                dept_list[dept_data.parent.id] = {
-                    "deptId": dept_data.parent.id,
-                    "deptName": dept_data.parent.name
-                }
-            elif dept_data.type == Department.TYPE_SUBUNIT:
-                if dept_data.parent.parent.id in dept_list: continue
-                dept_list[dept_data.parent.parent.id] = {
-                    "deptId": dept_data.parent.parent.id,
-                    "deptName": dept_data.parent.parent.name
-                }
+            departments = departments.filter(id__in=department_ids)
+        hierarchy = DepartmentHierarchy(departments)
+
+        for dept_id in hierarchy.roots:
+            root = hierarchy.root(dept_id)
+            if root['id'] in dept_list: continue
+            dept_list[root['id']] = {
+                "deptId": root['id'],
+                "deptName": root['name']
+            }
         return dept_list.values()
 
     def check_for_IDOR(self, token, account_id):
         if token['iss'] != settings.JWT_ISSUER:
             return True, ""
 
-        account_list = Account.objects.origin_query().filter(
-            Q(id=token['accountId']) | Q(parent_id=token['accountId'])).values_list('id', flat=True)
+        account_list = get_account_family(token['accountId'])
 
         if not token['accountId'] in account_list:
             return False, "not allowed"
@@ -2055,8 +3578,7 @@ class DeptListAccountView(APIView):
 class DeptListRequestorView(APIView):
     @partial(loginRequired, module="ACCOUNT", access="MANAGE")
     def get(self, request, dept_id=""):
-        result = []
-        token = get_token_data(self.request.META, key=None, all=True)
+        token = get_auth_context(self.request)
 
         id_query = request.GET.get('id', '')
         accountId_input = request.GET.get('accountId', '')
@@ -2076,26 +3598,21 @@ class DeptListRequestorView(APIView):
                     return response(403, message="not allowed", status=False)
                 account_id = accountId_input
 
-            for requestor_data in ContactDepartmentRequestor.objects.filter(
-                    department__account_id=account_id).distinct('contact_id'):
-                fullname = [requestor_data.contact.first_name, requestor_data.contact.last_name]
-                result.append({
-                    "requestor_id": requestor_data.contact.id,
-                    "requestor_name": " ".join(fullname),
-                    "department_name": requestor_data.department.name
-                })
+            rows = list(ContactDepartmentRequestor.objects.filter(department__account_id=account_id)
+                        .distinct('contact_id').values_list('contact_id', 'department__name'))
+            requestors = self.requestor_json(contact_id for contact_id, _ in rows)
+            result = [dict(requestors[contact_id], department_name=department_name)
+                      for contact_id, department_name in rows if contact_id in requestors]
             return response(200, data=result, message="get requestor data success", status=True)
 
         status, message = self.check_for_IDOR(token, dept_id)
         if not status:
             return response(403, message=message, status=False)
 
-        for requestor_data in ContactDepartmentRequestor.objects.filter(department_id=dept_id).distinct('contact_id'):
-            fullname = [requestor_data.contact.first_name, requestor_data.contact.last_name]
-            result.append({
-                "requestor_id": requestor_data.contact.id,
-                "requestor_name": " ".join(fullname),
-            })
+        contact_ids = list(ContactDepartmentRequestor.objects.filter(department_id=dept_id).distinct('contact_id')
+                           .values_list('contact_id', flat=True))
+        requestors = self.requestor_json(contact_ids)
+        result = [requestors[contact_id] for contact_id in contact_ids if contact_id in requestors]
 
         meta = {
             "page": 1,
@@ -2107,19 +3624,16 @@ class DeptListRequestorView(APIView):
 
 
     def get_multi_requestors(self, token, id_query):
-        result = []
         id_list = id_query.split(',')
 
         status, message = self.check_for_IDOR(token, id_list, many=True)
         if not status:
             return response(403, message=message, status=False)
 
-        for requestor_data in ContactDepartmentRequestor.objects.filter(department_id__in=id_list).distinct('contact_id'):
-            fullname = [requestor_data.contact.first_name, requestor_data.contact.last_name]
-            result.append({
-                "requestor_id": requestor_data.contact.id,
-                "requestor_name": " ".join(fullname),
-            })
+        contact_ids = list(ContactDepartmentRequestor.objects.filter(department_id__in=id_list).distinct('contact_id')
+                           .values_list('contact_id', flat=True))
+        requestors = self.requestor_json(contact_ids)
+        result = [requestors[contact_id] for contact_id in contact_ids if contact_id in requestors]
 
         meta_data = {
             "page": 1,
@@ -2130,12 +3644,22 @@ class DeptListRequestorView(APIView):
         return response(200, data=result, message="get requestor data success", status=True, meta=meta_data)
 
 
+    def requestor_json(self, contact_ids):
+        # requestor id & name per contact id, names loaded with one contact query
+        contact_loader = ContactLoader()
+        contact_loader.add(contact_ids)
+        return {
+            contact_id: {
+                "requestor_id": contact_id,
+                "requestor_name": " ".join([contact.first_name, contact.last_name]),
+            } for contact_id, contact in contact_loader.load().items()
+        }
+
     def check_for_IDOR(self, token, dept_id, many=False):
         if token['iss'] != settings.JWT_ISSUER:
             return True, ""
 
-        account_list = Account.objects.origin_query().filter(
-            Q(id=token['accountId']) | Q(parent_id=token['accountId'])).values_list('id', flat=True)
+        account_list = get_account_family(token['accountId'])
 
         if not many:
             dept_id = Department.objects.origin_query().filter(id=dept_id).first()
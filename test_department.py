@@ -0,0 +1,197 @@
+import itertools
+import random
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+import department
+
+JWT_ISSUER = 'department-test'
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def run_on_commit(func):
+    # outside of a transaction on_commit runs right away, without touching the database
+    func()
+
+
+@override_settings(JWT_ISSUER=JWT_ISSUER, CACHES=LOCMEM_CACHE)
+class IDORCheckTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.token = {'iss': JWT_ISSUER, 'contactId': 7, 'email': 'user@example.com'}
+
+        patcher = mock.patch.object(department.AccountContact.objects, 'origin_query')
+        self.origin_query = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(department.Department.objects, 'filter')
+        self.department_filter = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('department.transaction.on_commit', side_effect=run_on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_account_contacts(self, rows):
+        self.origin_query.return_value.filter.return_value.values_list.return_value = rows
+
+    def set_department_exists(self, exists):
+        self.department_filter.return_value.exists.return_value = exists
+
+    def test_cms_issuer_is_always_allowed(self):
+        self.token['iss'] = 'cms'
+
+        self.assertTrue(department.is_passed_IDOR_check(self.token, 10))
+        self.origin_query.assert_not_called()
+
+    def test_disabled_contact_is_denied(self):
+        # disabled contacts & deleted account contacts are filtered out by the query
+        self.set_account_contacts([])
+
+        self.assertFalse(department.is_passed_IDOR_check(self.token, 10))
+        self.origin_query.return_value.filter.assert_called_once_with(
+            contact_id=7, contact__email='user@example.com', contact__is_disabled=False, is_delete=False)
+        self.department_filter.assert_not_called()
+
+    def test_admin_is_allowed_on_any_department(self):
+        self.set_account_contacts([(1, False), (2, True)])
+
+        self.assertTrue(department.is_passed_IDOR_check(self.token, 10))
+        self.department_filter.assert_not_called()
+
+    def test_non_admin_is_allowed_on_department_of_its_accounts(self):
+        self.set_account_contacts([(1, False), (2, False)])
+        self.set_department_exists(True)
+
+        self.assertTrue(department.is_passed_IDOR_check(self.token, '10'))
+        self.department_filter.assert_called_once_with(id=10, account_id__in=[1, 2])
+
+    def test_non_admin_is_denied_on_other_department(self):
+        self.set_account_contacts([(1, False)])
+        self.set_department_exists(False)
+
+        self.assertFalse(department.is_passed_IDOR_check(self.token, 10))
+
+    def test_answer_is_cached(self):
+        self.set_account_contacts([(1, True)])
+
+        department.is_passed_IDOR_check(self.token, 10)
+        department.is_passed_IDOR_check(self.token, 10)
+
+        self.assertEqual(self.origin_query.call_count, 1)
+
+    def test_contact_reset_invalidates_cached_answer(self):
+        self.set_account_contacts([(1, True)])
+        self.assertTrue(department.is_passed_IDOR_check(self.token, 10))
+
+        # admin flag revoked
+        self.set_account_contacts([])
+        department.reset_idor_cache(self.token['contactId'])
+
+        self.assertFalse(department.is_passed_IDOR_check(self.token, 10))
+
+    def test_department_reset_invalidates_cached_answer(self):
+        self.set_account_contacts([(1, False)])
+        self.set_department_exists(True)
+        self.assertTrue(department.is_passed_IDOR_check(self.token, 10))
+
+        # department moved to another account
+        self.set_department_exists(False)
+        department.reset_idor_cache()
+
+        self.assertFalse(department.is_passed_IDOR_check(self.token, 10))
+
+    def test_reset_bumps_again_on_commit(self):
+        callbacks = []
+        version = department.idor_cache_version(7)
+
+        with mock.patch('department.transaction.on_commit', side_effect=callbacks.append):
+            department.reset_idor_cache(7)
+        bumped = department.idor_cache_version(7)
+        callbacks[0]()
+
+        self.assertNotEqual(bumped, version)
+        self.assertNotEqual(department.idor_cache_version(7), bumped)
+
+    def test_evicted_version_does_not_restart_from_old_value(self):
+        version = department.idor_cache_version(7)
+        cache.delete('{}:{}'.format(department.IDOR_CACHE_VERSION, 7))
+
+        self.assertNotEqual(department.idor_cache_version(7), version)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class UpdateOrderTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(department.ContactDepartmentApproval.objects, 'filter')
+        self.approval_filter = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('department.transaction.on_commit', side_effect=run_on_commit)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def apply_update(self, levels, mapping):
+        # run update_order on approvers at `levels` & apply the single UPDATE it issues the way the database does,
+        # every row evaluates the CASE against its order before the statement
+        data = {"approvalNumber": levels, "order": [{"old": old, "new": new} for old, new in mapping.items()]}
+        self.assertIsNone(department.update_order(data, levels, 10))
+
+        self.approval_filter.assert_called_once_with(department_id=10)
+        rows = self.approval_filter.return_value.filter
+        rows.assert_called_once_with(order__in=list(mapping))
+        rows.return_value.update.assert_called_once()
+        case = rows.return_value.update.call_args.kwargs['order']
+
+        whens = {when.condition.children[0][1]: when.result.value for when in case.cases}
+        self.assertEqual(case.default.name, 'order')
+        return {'contact-{}'.format(level): whens.get(level, level) for level in range(1, levels + 1)}
+
+    def assert_reordered(self, levels, mapping):
+        reordered = self.apply_update(levels, mapping)
+
+        expected = {'contact-{}'.format(level): mapping.get(level, level) for level in range(1, levels + 1)}
+        self.assertEqual(reordered, expected)
+        # still one approver per level
+        self.assertEqual(sorted(reordered.values()), list(range(1, levels + 1)))
+
+    def test_swap(self):
+        self.assert_reordered(2, {1: 2, 2: 1})
+
+    def test_swap_within_ten_levels(self):
+        self.assert_reordered(10, {3: 8, 8: 3})
+
+    def test_cycle_of_ten_levels(self):
+        self.assert_reordered(10, {level: level % 10 + 1 for level in range(1, 11)})
+
+    def test_reverse_cycle_of_ten_levels(self):
+        self.assert_reordered(10, {level: (level - 2) % 10 + 1 for level in range(1, 11)})
+
+    def test_every_permutation_up_to_five_levels(self):
+        for levels in range(1, 6):
+            for permutation in itertools.permutations(range(1, levels + 1)):
+                with self.subTest(permutation=permutation):
+                    self.approval_filter.reset_mock()
+                    self.assert_reordered(levels, dict(zip(range(1, levels + 1), permutation)))
+
+    def test_random_permutations_up_to_ten_levels(self):
+        shuffle = random.Random(20)
+        for levels in range(6, 11):
+            for _ in range(50):
+                permutation = list(range(1, levels + 1))
+                shuffle.shuffle(permutation)
+                with self.subTest(permutation=permutation):
+                    self.approval_filter.reset_mock()
+                    self.assert_reordered(levels, dict(zip(range(1, levels + 1), permutation)))
+
+    def test_zero_approval_number_deletes_approvers(self):
+        data = {"approvalNumber": 0, "order": []}
+
+        self.assertIsNone(department.update_order(data, 3, 10))
+        self.approval_filter.return_value.delete.assert_called_once_with()
+
+    def test_level_above_approval_number_is_rejected(self):
+        data = {"approvalNumber": 3, "order": [{"old": 4, "new": 1}]}
+
+        self.assertEqual(department.update_order(data, 3, 10),
+                         "the old level should not exceed the maximum approval number")
+        self.approval_filter.assert_not_called()